@@ -1,13 +1,13 @@
 from src import common_module as cm
 from src.common.constants import SystemConstants, DbTypeConstants
-from src.common.utils import DateUtils, SystemUtils, SqlUtils, ExcelUtils
+from src.common.utils import DateUtils, SystemUtils, ExcelUtils
 from src.analysis_extend_target import OracleTarget
+from src.common.report_utils import ConfigSnapshot, QueryCache, QueryStreamUtils, SqlTemplateEngine, WorkbookSession, ChartDownsampler, DateTimeLabelFormatter, \
+    TargetFanOut, LocalColumnarStore, StageTimer
 
 import os
 import re
 import pandas as pd
-from openpyxl import load_workbook
-from resources.config_manager import Config
 from openpyxl.chart import Reference
 import warnings
 
@@ -18,9 +18,15 @@ class MetricPerformanceReport(cm.CommonModule):
     EXCEL에 데이터 및 그래프 INSERT
     """
 
+    DATA_START_COL = 2  # sheet 데이터 시작 위치 (0-based, C30)
+    DATA_START_ROW = 29
+    DEFAULT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+    CHART_SOURCE_SHEET_FORMAT = "CHART_SOURCE_{}"
+
     def __init__(self, logger):
         super().__init__(logger=logger)
         self.ot: OracleTarget = None
+        self.timer = StageTimer("MetricPerformanceReport")
 
     def main_process(self):
         """
@@ -29,8 +35,19 @@ class MetricPerformanceReport(cm.CommonModule):
 
         self.logger.info("metric performance report")
         warnings.filterwarnings(action='ignore')
-        self._insert_extend_target_data()
-        self._insert_datatable_or_chartgraph()
+
+        if TargetFanOut.is_fan_out(self.config):
+            TargetFanOut.run(MetricPerformanceReport, self.config, self.logger)
+            return
+
+        with self.timer.stage("connect"):
+            self._insert_extend_target_data()
+
+        try:
+            self._insert_datatable_or_chartgraph()
+
+        finally:
+            self.timer.report(self.logger, ConfigSnapshot.get("report"), self.config.get(TargetFanOut.TARGET_NAME_KEY))
 
     def _insert_extend_target_data(self):
         """
@@ -48,74 +65,86 @@ class MetricPerformanceReport(cm.CommonModule):
                 self.ot.set_extend_target_config(extend_target_repo)
                 self.ot.init_process()
 
-    def _convert_sql_to_df(self, sql_path, filename):
+    def _convert_sql_to_df(self, sql_path, filename, start_date=None):
         """
         sql query문을 dataframe 형태로 변환
+        start_date(datetime) 가 있으면 조회 시작 시각을 s_date 와 같은 형식의 start_date 로 대체 (incremental 조회)
         """
-        metric_name_list = self._extract_metric_name_list()
-        unpack_metric_name_list = str(metric_name_list)[1:-1]
-
         s_date, e_date = DateUtils.get_each_date_by_interval2(
             self.config["args"]["s_date"], self.config["args"]["interval"], arg_fmt="%Y-%m-%d"
         )
-        date_dict = {"StartDate": s_date, "EndDate": e_date, "Metric_Name": unpack_metric_name_list}
-
-        query = SystemUtils.get_file_content_in_path(sql_path, filename + ".txt")
-        date_query = SqlUtils.sql_replace_to_dict(query, date_dict)
-
-        for df in self.ot.get_data_by_query(date_query):
-            df.columns = [i.upper() for i in df.columns]
-            return df
-
-    def _read_excel(self, excel_file_path):
-        wb = load_workbook(excel_file_path)
-        return wb
-
-    def _extract_metric_name_list(self):
-        metric_name_list = [
-            "Host CPU Utilization (%)",
-            "Average Active Sessions",
-            "Executions Per Sec",
-            "User Transaction Per Sec",
-            "Logical Reads Per Sec",
-            "Physical Reads Per Sec",
-            "Hard Parse Count Per Sec",
-        ]
 
-        config_report = Config("report").get_config()
-        metric_name_list.extend(config_report["sys_metric"])
+        if start_date is not None:
+            date_format = LocalColumnarStore.find_date_format(str(s_date)) or MetricPerformanceReport.DEFAULT_DATE_FORMAT
+            s_date = start_date.strftime(date_format)
 
-        return metric_name_list
+        date_dict = {"StartDate": s_date, "EndDate": e_date, "Metric_Name": ConfigSnapshot.metric_name_list()}
 
-    def _make_union_df(self, df, metric_name):
-        metric_dic = {}
-        metric_value_list = []
+        config_report = ConfigSnapshot.get("report")
+        sql_engine = SqlTemplateEngine.get(sql_path, config_report)
+        prepared_sql = sql_engine.prepare(filename, date_dict)
 
-        metric_df = df[df["METRIC_NAME"] == metric_name]
+        query_cache = QueryCache.from_config(config_report, self.config)
+        cached_df = query_cache.get(filename, prepared_sql.cache_text)
 
-        metric_df["DATE_TIME"] = metric_df["DATE_TIME"].astype(str) + ":00"
-        metric_df["DATE_TIME"] = metric_df["DATE_TIME"].apply(lambda x: "\n".join(x.split()))
+        if cached_df is not None:
+            return cached_df
 
-        for idx, instance_num in enumerate(metric_df["INSTANCE_NUMBER"].unique()):
-            extract_df = metric_df[metric_df["INSTANCE_NUMBER"] == instance_num]
-            variable_name = f"extract_df_{instance_num}"
-            metric_dic[variable_name] = extract_df.rename(
-                columns={
-                    "AG": f"AVG_{instance_num}",
-                    "INSTANCE_NUMBER": f"INSTANCE_NUMBER_{instance_num}",
-                    "MX": f"MAX_{instance_num}",
-                }
-            )
+        local_store = LocalColumnarStore.from_config(config_report, self.config)
+
+        with self.timer.stage("query", filename) as record:
+            df = QueryStreamUtils.fetch_df(sql_engine, filename, date_dict, self.ot, local_store)
+            record.set_frame(df)
+        query_cache.put(filename, prepared_sql.cache_text, df)
+        return df
+
+    def _make_pivot_df(self, df):
+        """
+        SYSMETRIC 조회 결과 전체를 한 번의 pivot_table 로 metric 별 wide frame 으로 변환
+        index: (METRIC_NAME, DATE_TIME), columns: instance 별 INSTANCE_NUMBER_n / AVG_n / MAX_n
+        """
+        with self.timer.stage("preprocess", "pivot") as record:
+            pivot_df = self._pivot_metric_df(df)
+            record.set_frame(pivot_df)
+
+        return pivot_df
+
+    def _pivot_metric_df(self, df):
+        rename_dict = {"AG": "AVG", "MX": "MAX"}
+        value_col_list = [col for col in df.columns if col not in ("DATE_TIME", "METRIC_NAME")]
+        instance_num_list = df["INSTANCE_NUMBER"].unique()
 
-            metric_value_list = list(metric_dic.values())
+        date_time = DateTimeLabelFormatter.format(df["DATE_TIME"])
 
-        result_df = (
-            pd.DataFrame()
-            .join([d.set_index(["DATE_TIME", "METRIC_NAME"]) for d in metric_value_list], how="outer")
-            .reset_index()
+        pivot_df = pd.pivot_table(
+            df.assign(DATE_TIME=date_time, PIVOT_INSTANCE=df["INSTANCE_NUMBER"]),
+            index=["METRIC_NAME", "DATE_TIME"],
+            columns="PIVOT_INSTANCE",
+            values=value_col_list,
+            aggfunc="first",
         )
 
-        return result_df
+        ordered_col_list = [
+            (col, instance_num)
+            for instance_num in instance_num_list
+            for col in value_col_list
+            if (col, instance_num) in pivot_df.columns
+        ]
+        pivot_df = pivot_df[ordered_col_list]
+        pivot_df.columns = [f"{rename_dict.get(col, col)}_{instance_num}" for col, instance_num in ordered_col_list]
+
+        return pivot_df
+
+    def _make_union_df(self, pivot_df, metric_name):
+        """
+        pivot_df 에서 metric_name 에 해당하는 sheet 데이터 slice
+        """
+        if metric_name not in pivot_df.index.get_level_values("METRIC_NAME"):
+            return pd.DataFrame(columns=["DATE_TIME", "METRIC_NAME"])
+
+        result_df = pivot_df.loc[[metric_name]].dropna(axis=1, how="all").reset_index()
+        ordered_col_list = ["DATE_TIME", "METRIC_NAME"] + list(result_df.columns[2:])
+        return result_df[ordered_col_list]
 
     def _insert_datatable_or_chartgraph(self):
         """
@@ -123,7 +152,7 @@ class MetricPerformanceReport(cm.CommonModule):
         {number} txt 파일명 추출
         """
         sql_path = f"{self.config['home']}/" + SystemConstants.CHART_SQL
-        excel_path = f"{self.config['home']}/" + SystemConstants.CHART_EXCEL
+        excel_path = TargetFanOut.make_target_path(self.config, f"{self.config['home']}/" + SystemConstants.CHART_EXCEL)
         os.makedirs(excel_path, exist_ok=True)
         txt_file_list = SystemUtils.get_filenames_from_path(sql_path)
 
@@ -133,121 +162,202 @@ class MetricPerformanceReport(cm.CommonModule):
 
             if re.search(r"-(\d+)", filename):
                 df = self._convert_sql_to_df(sql_path, filename)
-                ExcelUtils.excel_export(excel_file_path, "Sheet1", df)
+
+                with self.timer.stage("workbook", filename):
+                    ExcelUtils.excel_export(excel_file_path, "Sheet1", df)
 
             elif re.search(r"CHART", filename):
-                self.check_excel_format(excel_file_path, sql_path, filename)
+                with self.timer.stage("workbook", filename):
+                    self.check_excel_format(excel_file_path, sql_path, filename)
 
     def check_excel_format(self, excel_file_path, sql_path, filename):
         """
         excel 파일이 있으면 해당 파일에 데이터 overwrite하고
         excel 파일이 없으면 새로 생성하여 데이터 insert 한다.
+        workbook 은 session 으로 한 번만 load / save 한다.
         """
-        if os.path.isfile(excel_file_path):
-            #self.logger.info(f"{filename}: filename OVERWRITE")
-            self._check_sheet_name_list(excel_file_path, sql_path, filename)
-            self._apply_excel_style(excel_file_path, sql_path, filename)
-            self._insert_linechart_from_data(excel_file_path)
+        incremental = ConfigSnapshot.get("report").get("metric_report", {}).get("incremental", False)
 
-        else:
-            #self.logger.info(f"{filename}: filename INSERT")
-            self._make_excel_sheet_data(excel_file_path, sql_path, filename)
-            self._apply_excel_style(excel_file_path, sql_path, filename)
-            self._insert_linechart_from_data(excel_file_path)
+        with WorkbookSession(excel_file_path) as session:
+            if session.exists and incremental and self._append_excel_sheet(session, sql_path, filename):
+                self.logger.info(f"{filename}: filename APPEND")
 
-    def _make_excel_sheet_data(self, excel_file_path, sql_path, filename):
+            elif session.exists:
+                #self.logger.info(f"{filename}: filename OVERWRITE")
+                self._check_sheet_name_list(session, sql_path, filename)
+
+            else:
+                #self.logger.info(f"{filename}: filename INSERT")
+                self._make_excel_sheet_data(session, sql_path, filename)
+
+            self._apply_excel_style(session, sql_path, filename)
+            self._insert_linechart_from_data(session)
+
+    def _make_excel_sheet_data(self, session, sql_path, filename):
         df = self._convert_sql_to_df(sql_path, filename)
         metric_name_list = df["METRIC_NAME"].unique()
-        ExcelUtils.create_excel_and_sheet(excel_file_path, metric_name_list)
-        self._insert_df_into_excel(excel_file_path, df, metric_name_list)
+        session.create_sheets(metric_name_list)
+        self._insert_df_into_excel(session, self._make_pivot_df(df), metric_name_list)
 
-    def _insert_df_into_excel(self, excel_file_path, df, metric_name_list):
+    def _insert_df_into_excel(self, session, pivot_df, metric_name_list):
         for metric_name in metric_name_list:
-            result_df = self._make_union_df(df, metric_name)
-            ExcelUtils.append_df_into_excel(excel_file_path, metric_name, result_df, 2, 29, "overlay")
+            result_df = self._make_union_df(pivot_df, metric_name)
+            session.write_df(metric_name, result_df, MetricPerformanceReport.DATA_START_COL,
+                             MetricPerformanceReport.DATA_START_ROW, "overlay")
 
-    def _check_sheet_name_list(self, excel_file_path, sql_path, filename):
+    def _check_sheet_name_list(self, session, sql_path, filename):
         """
         sheet_name check
         """
-        wb = self._read_excel(excel_file_path)
         df = self._convert_sql_to_df(sql_path, filename)
-        metric_name_list = self._extract_metric_name_list()
+        pivot_df = self._make_pivot_df(df)
+        metric_name_list = ConfigSnapshot.metric_name_list()
 
         not_exist_sheet_list = []
         exist_sheet_list = []
 
         for sheet_name in metric_name_list:
-            if sheet_name in wb.get_sheet_names():
+            if sheet_name in session.sheet_names():
                 exist_sheet_list.append(sheet_name)
             else:
                 not_exist_sheet_list.append(sheet_name)
 
-        wb.close()
-
         if len(not_exist_sheet_list) != 0:
             #self.logger.info(f"{filename}: filename, {sheet_name} : not_exist_sheet")
-            self._insert_df_into_excel(excel_file_path, df, not_exist_sheet_list)
+            self._insert_df_into_excel(session, pivot_df, not_exist_sheet_list)
 
         #self.logger.info(f"{filename} overwrite START!")
-        self._overwrite_excel_sheet(exist_sheet_list, excel_file_path, df)
+        self._overwrite_excel_sheet(session, exist_sheet_list, pivot_df)
 
-    def _overwrite_excel_sheet(self, sheet_name_list, excel_file_path, df):
+    def _overwrite_excel_sheet(self, session, sheet_name_list, pivot_df):
         for sheet_name in sheet_name_list:
-            wb = self._read_excel(excel_file_path)
-            ws = wb[sheet_name]
-            wb.close()
+            ws = session.wb[sheet_name]
 
-            result_df = self._make_union_df(df, sheet_name)
+            result_df = self._make_union_df(pivot_df, sheet_name)
             col = [cell for cell in ws[ws.min_row] if cell.value == "DATE_TIME"]
 
             for date_time_cell in col:
-                ExcelUtils.append_df_into_excel(
-                    excel_file_path, sheet_name, result_df, date_time_cell.column - 1, ws.min_row - 1, "replace"
-                )
+                session.write_df(sheet_name, result_df, date_time_cell.column - 1, ws.min_row - 1, "replace")
+
+    def _append_excel_sheet(self, session, sql_path, filename):
+        """
+        metric sheet 마지막 DATE_TIME(watermark) 이후 데이터만 조회하여 sheet 끝에 추가
+        sheet 가 없거나 watermark 를 읽을 수 없으면 False (전체 overwrite 로 처리)
+        """
+        watermark_dict = {}
+
+        for metric_name in ConfigSnapshot.metric_name_list():
+            if metric_name not in session.sheet_names():
+                return False
+
+            watermark = self._read_watermark(session.wb[metric_name])
+
+            if watermark is None:
+                return False
+
+            watermark_dict[metric_name] = watermark
+
+        # s_date 가 일자 단위 형식이면 watermark 일자 처음부터 조회되고, 이미 있는 행은 아래에서 watermark 기준으로 제외된다
+        df = self._convert_sql_to_df(sql_path, filename, min(watermark_dict.values()))
+
+        if df is None or df.empty:
+            return True
+
+        pivot_df = self._make_pivot_df(df)
+
+        for metric_name, watermark in watermark_dict.items():
+            result_df = self._make_union_df(pivot_df, metric_name)
+            date_time = pd.to_datetime(result_df["DATE_TIME"].str.replace("\n", " ", regex=False), errors="coerce")
+            ws = session.wb[metric_name]
+            date_time_cell = self._find_date_time_cell(ws)
+            session.append_df(metric_name, result_df[date_time > watermark], ws.min_row, date_time_cell.column - 1)
+
+        return True
+
+    def _read_watermark(self, ws):
+        """sheet DATE_TIME 컬럼의 마지막 값 (datetime)"""
+        date_time_cell = self._find_date_time_cell(ws)
+
+        if date_time_cell is None:
+            return None
+
+        for row in range(ws.max_row, ws.min_row, -1):
+            value = ws.cell(row=row, column=date_time_cell.column).value
 
-    def _apply_excel_style(self, excel_file_path, sql_path, filename):
+            if value is not None:
+                watermark = pd.to_datetime(str(value).replace("\n", " "), errors="coerce")
+                return None if pd.isna(watermark) else watermark
+
+        return None
+
+    def _find_date_time_cell(self, ws):
+        return next((cell for cell in ws[ws.min_row] if cell.value == "DATE_TIME"), None)
+
+    def _apply_excel_style(self, session, sql_path, filename):
         """
         excel에 dataframe 기입시 스타일 지정
         table border_style, column width 지정
         """
-        wb = self._read_excel(excel_file_path)
-        df = self._convert_sql_to_df(sql_path, filename)
-        unique_metric_name = df["METRIC_NAME"].unique()
+        unique_metric_name = [name for name in ConfigSnapshot.metric_name_list() if name in session.sheet_names()]
 
         for metric_name in unique_metric_name:
-            ws = wb[metric_name]
+            ws = session.wb[metric_name]
             SystemUtils.apply_thin_border(ws, "thin")
             SystemUtils.apply_column_width(ws, 20)
 
-        wb.save(excel_file_path)
-        wb.close()
+    def _insert_linechart_from_data(self, session):
+        """
+        metric sheet 에 AVG / MAX line chart 생성
+        excel downsampling 이 켜져 있으면 sheet table 은 그대로 두고 숨김 sheet 의 축소 데이터로 chart 를 그린다.
+        """
+        metric_name_list = ConfigSnapshot.metric_name_list()
+        max_points, method, excel_downsample = ChartDownsampler.get_option(ConfigSnapshot.get("report"))
 
-    def _insert_linechart_from_data(self, excel_file_path):
-        wb = self._read_excel(excel_file_path)
-        metric_name_list = self._extract_metric_name_list()
+        for idx, metric_name in enumerate(metric_name_list):
+            ws = session.wb[metric_name]
 
-        for metric_name in metric_name_list:
-            ws = wb[metric_name]
+            # 이전 실행에서 추가한 chart 는 제거하고 현재 데이터 범위로 다시 생성
+            ws._charts = []
 
-            avg_col = [cell for cell in ws[ws.min_row] if isinstance(cell.value, str) and re.search(r"AVG", cell.value)]
-            max_col = [cell for cell in ws[ws.min_row] if isinstance(cell.value, str) and re.search(r"MAX", cell.value)]
+            source_ws = ws
+            if excel_downsample and max_points:
+                source_ws = self._make_chart_source_sheet(session, ws, idx, max_points, method)
+
+            date_time_cell = self._find_date_time_cell(source_ws)
+            header_row = source_ws[source_ws.min_row]
+
+            avg_col = [cell for cell in header_row if isinstance(cell.value, str) and re.search(r"AVG", cell.value)]
+            max_col = [cell for cell in header_row if isinstance(cell.value, str) and re.search(r"MAX", cell.value)]
 
             category = Reference(
-                ws, min_col=ws.min_column + 2, max_col=ws.min_column + 2, min_row=ws.min_row + 1, max_row=ws.max_row
+                source_ws, min_col=date_time_cell.column, max_col=date_time_cell.column,
+                min_row=source_ws.min_row + 1, max_row=source_ws.max_row
             )
 
             AVG_METRIC_NAME = f"{metric_name}-AVG"
             line_chart_avg = ExcelUtils.set_linechart_object(AVG_METRIC_NAME)
-            ExcelUtils.set_data_and_category(ws, category, avg_col, line_chart_avg)
+            ExcelUtils.set_data_and_category(source_ws, category, avg_col, line_chart_avg)
             ExcelUtils.set_series_marker_style(line_chart_avg.series)
             ws.add_chart(line_chart_avg, "C1")
 
             MAX_METRIC_NAME = f"{metric_name}-MAX"
             line_chart_max = ExcelUtils.set_linechart_object(MAX_METRIC_NAME)
-            ExcelUtils.set_data_and_category(ws, category, max_col, line_chart_max)
+            ExcelUtils.set_data_and_category(source_ws, category, max_col, line_chart_max)
             ExcelUtils.set_series_marker_style(line_chart_max.series)
             ws.add_chart(line_chart_max, "C15")
 
-        wb.save(excel_file_path)
-        wb.close()
+    def _make_chart_source_sheet(self, session, ws, idx, max_points, method):
+        """
+        metric sheet table 을 downsampling 하여 chart 전용 숨김 sheet 에 기록 (매 실행마다 새로 생성)
+        """
+        date_time_cell = self._find_date_time_cell(ws)
+        row_list = list(ws.iter_rows(min_row=ws.min_row, min_col=date_time_cell.column, values_only=True))
+        df = pd.DataFrame(row_list[1:], columns=row_list[0])
+
+        value_col_list = [col for col in df.columns if re.search(r"^(AVG|MAX)_", str(col))]
+        df[value_col_list] = df[value_col_list].apply(pd.to_numeric, errors="coerce")
+        chart_df = ChartDownsampler.downsample_df(df, value_col_list, max_points, method)
+
+        source_ws = session.write_df(MetricPerformanceReport.CHART_SOURCE_SHEET_FORMAT.format(idx), chart_df, 0, 0, "replace")
+        source_ws.sheet_state = "hidden"
+        return source_ws
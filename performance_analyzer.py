@@ -1,16 +1,18 @@
 import copy
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src import common_module as cm
 from src.common.constants import SystemConstants, DbTypeConstants
-from src.common.utils import DateUtils, SystemUtils, SqlUtils
+from src.common.utils import DateUtils
 from src.analysis_extend_target import OracleTarget
-from src.ppt.ppt_writer import SlideManager
+from src.ppt.ppt_writer import SlideManager, SlideIndex, TemplateBlueprint
+from src.common.report_utils import ConfigSnapshot, QueryCache, QueryStreamUtils, TopNAggregator, ChartDownsampler, DateTimeLabelFormatter, \
+    DataFramePartition, SqlTemplateEngine, TargetFanOut, LocalColumnarStore, ArrowFrameStore, \
+    StageTimer
 
 import pandas as pd
 import re
 
-from resources.config_manager import Config
-
 from pptx import Presentation
 from pptx.util import Inches
 from pptx.dml.color import RGBColor
@@ -57,47 +59,166 @@ class PerformanceAnalyzer(cm.CommonModule):
     MEMORY = "#MEMORY"
     TOP_3 = "#TOP_3_Wait_Events"
 
+    TOP_3_SQL_LIST = ["TOP_1_Wait_Events", "TOP_2_Wait_Events", "TOP_3_Wait_Events"]
+    BATCH_SQL_SUFFIX = "_BATCH"
+
+    DEFAULT_FETCH_POOL_SIZE = 4
+
+    SECTION_SQL = {
+        "_execute_time_model": ["TIME_MODEL"],
+        "_execute_db_system": ["DB_SYSTEM"],
+        "_execute_metric": ["METRIC"],
+        "_execute_rac": ["RAC"],
+        "_execute_top_n_wait_events": ["TOP_N_Wait_Events"],
+        # TOP_N_Wait_Events 는 chunk 단위 집계(_aggregate_sql_chunks)만 하므로 prefetch 하지 않는다
+        "_execute_top_3_wait_events": [],
+        "_execute_top_schema_sql": ["TOP_Schema_SQL", "TOP_Schema_SQL2"],
+        "_execute_memory": ["MEMORY_INFO", "MEMORY_AMM"],
+        "_execute_literal_sql": ["Literal_SQL"],
+    }
+
     def __init__(self, logger):
         super().__init__(logger=logger)
         self.ot: OracleTarget = None
         self.sql_path = None
         self.position = None
         self.presentiton_path = 'sample_test.pptx'
-        self.presentation = Presentation(self.presentiton_path)
+        self._presentation = None
+        self._slide_index = None
+        self._blueprint = None
         self.instance_number = None
         self.instance_name = None
+        self.prefetched_df_dict = {}
+        self.arrow_store = None
+        self.timer = StageTimer("PerformanceAnalyzer")
 
     def main_process(self):
 
         self.logger.info("performance_analyzer.pptx")
-        self._insert_extend_target_data()
 
-        self.instance_number = self._extract_instance_info('instance_number')
-        self.instance_name = self._extract_instance_info('instance_name')
+        if TargetFanOut.is_fan_out(self.config):
+            TargetFanOut.run(PerformanceAnalyzer, self.config, self.logger)
+            return
+
+        with self.timer.stage("connect"):
+            self._insert_extend_target_data()
+
+            self.instance_number = self._extract_instance_info('instance_number')
+            self.instance_name = self._extract_instance_info('instance_name')
 
         self.sql_path = f"{self.config['home']}/" + SystemConstants.CHART_SQL
-        self.position = Config("position").get_config()
-
-        # self._execute_time_model()
-        # self._execute_db_system()
-        # self._execute_metric()
-        # self._execute_rac()
-        # self._execute_top_n_wait_events()
-        self._execute_top_3_wait_events()
-        # self._execute_top_schema_sql()
-        # self._execute_memory()
-        # self._execute_literal_sql()
-        # SlideManager.delete_slide(self.presentation)
+
+        # convert_inches_to_data 가 dict 를 직접 변환하므로 snapshot 복사본 사용
+        self.position = copy.deepcopy(ConfigSnapshot.get("position"))
+
+        section_list = [
+            # self._execute_time_model,
+            # self._execute_db_system,
+            # self._execute_metric,
+            # self._execute_rac,
+            # self._execute_top_n_wait_events,
+            self._execute_top_3_wait_events,
+            # self._execute_top_schema_sql,
+            # self._execute_memory,
+            # self._execute_literal_sql,
+        ]
+
+        try:
+            # 1단계: section 데이터 동시 조회, 2단계: template 순서대로 slide 생성
+            with self.timer.stage("prefetch"):
+                self._prefetch_section_data(section_list)
+
+            for section in section_list:
+                with self.timer.stage("section", section.__name__):
+                    section()
+
+        finally:
+            if self.arrow_store is not None:
+                self.arrow_store.close()
+
+            self.timer.report(self.logger, ConfigSnapshot.get("report"), self.config.get(TargetFanOut.TARGET_NAME_KEY))
+        # SlideManager.delete_slide(self.presentation, self.slide_index)
         # self.presentation.save("instance1.pptx")
 
+    @property
+    def blueprint(self):
+        """template 사전 분석 결과 (처음 사용할 때 load)"""
+        if self._blueprint is None:
+            with self.timer.stage("template", self.presentiton_path):
+                self._blueprint = TemplateBlueprint.load(self.presentiton_path)
+        return self._blueprint
+
+    @property
+    def presentation(self):
+        """slide 를 실제로 생성할 때 template load"""
+        if self._presentation is None:
+            self._presentation = Presentation(self.presentiton_path)
+        return self._presentation
+
+    @property
+    def slide_index(self):
+        if self._slide_index is None:
+            self._slide_index = SlideIndex(self.presentation, self.blueprint)
+        return self._slide_index
+
+    def _prefetch_section_data(self, section_list):
+        """
+        section 별 sql 을 thread pool 에서 동시에 조회하여 prefetched_df_dict 에 저장
+        (OracleTarget connection pool 공유)
+        arrow dataset 을 사용하면 조회가 끝나는 대로 IPC 파일로 내리고 dataframe 은 바로 버린다.
+        """
+        fetch_key_list = []
+
+        for section in section_list:
+            for filename in PerformanceAnalyzer.SECTION_SQL.get(section.__name__, []):
+                if filename == "RAC" and len(self.instance_name) == 1:
+                    continue
+
+                if filename == "Literal_SQL":
+                    fetch_key_list.extend((filename, "", str(inst_num)) for inst_num in self.instance_number)
+
+                else:
+                    fetch_key_list.append((filename, "", ""))
+
+        fetch_key_list = list(dict.fromkeys(fetch_key_list))
+
+        if not fetch_key_list:
+            return
+
+        pool_size = ConfigSnapshot.get("report").get("fetch_pool_size", PerformanceAnalyzer.DEFAULT_FETCH_POOL_SIZE)
+
+        self.arrow_store = ArrowFrameStore.from_config(ConfigSnapshot.get("report"), self.config)
+
+        with ThreadPoolExecutor(max_workers=min(pool_size, len(fetch_key_list))) as executor:
+            future_dict = {
+                executor.submit(self._convert_sql_to_df, self.sql_path, *fetch_key): fetch_key
+                for fetch_key in fetch_key_list
+            }
+
+            for future in as_completed(future_dict):
+                fetch_key = future_dict.pop(future)
+                df = future.result()
+
+                if self.arrow_store is None:
+                    self.prefetched_df_dict[fetch_key] = df
+
+                elif df is not None:
+                    self.arrow_store.put(fetch_key, df)
+
+    def _get_prefetched_df(self, fetch_key):
+        """
+        prefetch 결과 (arrow dataset 이면 memory map, 아니면 prefetch dict 의 dataframe 그대로)
+        복사하지 않으므로 결과를 수정하는 호출 측에서 copy 한다.
+        """
+        if self.arrow_store is not None and fetch_key in self.arrow_store:
+            return self.arrow_store.get(fetch_key)
+
+        prefetched_df = self.prefetched_df_dict.get(fetch_key)
+        return prefetched_df
+
     def _execute_delete_slide(self):
 
-        xml_slides = self.presentation.slides._sldIdLst
-        xml_slides_list = list(xml_slides)
-        for idx,slide in enumerate(self.presentation.slides):
-            for shape in slide.shapes:
-                if shape.has_text_frame and re.search(r"^#",  shape.text_frame.text):
-                    xml_slides.remove(xml_slides_list[idx])
+        SlideManager.delete_slide(self.presentation, self.slide_index)
 
     def _insert_extend_target_data(self):
         """
@@ -122,43 +243,71 @@ class PerformanceAnalyzer(cm.CommonModule):
             value_list.sort(reverse=False)
             return value_list
 
-    def _extract_metric_name_list(self):
+    def _convert_sql_to_df(self, sql_path, filename,event_name="", inst_num=""):
 
-        metric_name_list = [
-            "Host CPU Utilization (%)",
-            "Average Active Sessions",
-            "Executions Per Sec",
-            "User Transaction Per Sec",
-            "Logical Reads Per Sec",
-            "Physical Reads Per Sec",
-            "Hard Parse Count Per Sec",
-        ]
+        """
+        sql query문을 dataframe 형태로 변환 (prefetch 결과는 공유되므로 수정할 때는 copy 후 사용)
+        """
 
-        config_report = Config("report").get_config()
-        metric_name_list.extend(config_report["sys_metric"])
+        prefetched_df = self._get_prefetched_df((filename, event_name, inst_num))
 
-        return metric_name_list
+        if prefetched_df is not None:
+            return prefetched_df
 
-    def _convert_sql_to_df(self, sql_path, filename,event_name="", inst_num=""):
+        config_report = ConfigSnapshot.get("report")
+        date_dict = self._make_date_dict(event_name, inst_num)
+        sql_engine = SqlTemplateEngine.get(sql_path, config_report)
+        prepared_sql = sql_engine.prepare(filename, date_dict)
+
+        query_cache = QueryCache.from_config(config_report, self.config)
+        cached_df = query_cache.get(filename, prepared_sql.cache_text)
+
+        if cached_df is not None:
+            return cached_df
+
+        local_store = LocalColumnarStore.from_config(config_report, self.config)
+
+        with self.timer.stage("query", filename) as record:
+            df = QueryStreamUtils.fetch_df(sql_engine, filename, date_dict, self.ot, local_store)
+            record.set_frame(df)
 
+        if df is not None:
+            df = df.fillna(0)
+
+        query_cache.put(filename, prepared_sql.cache_text, df)
+        return df
+
+    def _aggregate_sql_chunks(self, sql_path, filename, aggregators, event_name="", inst_num=""):
         """
-        sql query문을 dataframe 형태로 변환
+        sql 결과 chunk 를 모두 읽으면서 aggregator 에 누적 (전체 결과를 메모리에 올리지 않음)
+        chunk 마다 fillna(0) 을 적용하여 _convert_sql_to_df / prefetch 결과와 같은 입력으로 집계한다.
         """
+        prefetched_df = self._get_prefetched_df((filename, event_name, inst_num))
+
+        if prefetched_df is not None:
+            return QueryStreamUtils.fold_chunks([prefetched_df], aggregators)
 
-        metric_name_list = self._extract_metric_name_list()
-        unpack_metric_name_list = str(metric_name_list)[1:-1]
+        prepared_sql = self._make_date_query(sql_path, filename, event_name, inst_num)
 
+        with self.timer.stage("query", filename):
+            return QueryStreamUtils.fold_chunks((df.fillna(0) for df in prepared_sql.fetch(self.ot)), aggregators)
+
+    def _make_date_query(self, sql_path, filename, event_name="", inst_num=""):
+        """
+        미리 읽어둔 sql template 에 조회 조건 적용 (PreparedSql)
+        """
+        date_dict = self._make_date_dict(event_name, inst_num)
+        return SqlTemplateEngine.get(sql_path, ConfigSnapshot.get("report")).prepare(filename, date_dict)
+
+    def _make_date_dict(self, event_name="", inst_num=""):
+        """
+        sql template 조회 조건 (event_name 이 tuple 이면 IN 절 목록으로 치환된다)
+        """
         s_date, e_date = DateUtils.get_each_date_by_interval2(
             self.config["args"]["s_date"], self.config["args"]["interval"], arg_fmt="%Y-%m-%d"
         )
-        date_dict = {"StartDate": s_date, "EndDate": e_date, "Metric_Name": unpack_metric_name_list,"EVENT_NAME":event_name, "INST_NUM":inst_num}
-
-        query = SystemUtils.get_file_content_in_path(sql_path, filename + ".txt")
-        date_query = SqlUtils.sql_replace_to_dict(query, date_dict)
-        for df in self.ot.get_data_by_query(date_query):
-            df.columns = [i.upper() for i in df.columns]
-            df = df.fillna(0)
-            return df
+        return {"StartDate": s_date, "EndDate": e_date, "Metric_Name": ConfigSnapshot.metric_name_list(),
+                "EVENT_NAME": event_name, "INST_NUM": inst_num}
 
     def is_even(self, i):
         return i % 2 == 0
@@ -171,8 +320,8 @@ class PerformanceAnalyzer(cm.CommonModule):
         right_tp = SlideManager.convert_inches_to_data(self.position['time_model']['right_table'])
         column_width_inches = [Inches(i) for i in self.position['time_model']['column_width_inches']]
 
-        time_model_df = self._convert_sql_to_df(self.sql_path, 'TIME_MODEL')
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TIME_MODEL)
+        time_model_df = DataFramePartition(self._convert_sql_to_df(self.sql_path, 'TIME_MODEL'), 'INSTANCE_NUMBER')
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TIME_MODEL, self.slide_index)
 
         k = 1
 
@@ -188,7 +337,7 @@ class PerformanceAnalyzer(cm.CommonModule):
 
             if i > 1 and i % 2 == 0:
 
-                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k)
+                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k, slide_index=self.slide_index)
                 SlideManager.create_text_box(copied_slide, self.position['top_menu']['left_top_text_position'],
                                              "DB Workload 1",
                                              PerformanceAnalyzer.LARGE_FONT_SIZE, PerformanceAnalyzer.FONT_NAME,
@@ -196,11 +345,11 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._time_model_detail(time_model_df, self.instance_number[i:i + 2], self.instance_name[i:i+2], copied_slide,left_tp,right_tp,column_width_inches)
                 k += 1
 
-    def _time_model_detail(self, df, instance_num_range, instance_name_range, slide,left_table_position,right_table_position,column_width_inches):
+    def _time_model_detail(self, partition, instance_num_range, instance_name_range, slide,left_table_position,right_table_position,column_width_inches):
 
         for i in range(len(instance_num_range)):
 
-            inst_df = df[df['INSTANCE_NUMBER'] == instance_num_range[i]]
+            inst_df = partition.get(instance_num_range[i])
             inst_num_drop_df = inst_df.drop(columns=['INSTANCE_NUMBER'])
 
             rec_position = self.position['time_model']['left_rectangle_position'] if self.is_even(i) else self.position['time_model']['right_rectangle_position']
@@ -221,8 +370,8 @@ class PerformanceAnalyzer(cm.CommonModule):
 
         column_width_inches = [Inches(i) for i in self.position['db_system']['column_width_inches']]
         tp = SlideManager.convert_inches_to_data(self.position['db_system']['table_position'])
-        df = self._convert_sql_to_df(self.sql_path, "DB_SYSTEM")
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, "#DB_SYSTEM")
+        df = DataFramePartition(self._convert_sql_to_df(self.sql_path, "DB_SYSTEM"), 'INSTANCE_NUMBER')
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, "#DB_SYSTEM", self.slide_index)
 
         k = 1
 
@@ -231,16 +380,13 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._db_system_detail(df, self.instance_number[0:2], target_slide,column_width_inches,tp,i)
 
             elif i % 2 == 0:
-                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k)
+                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k, slide_index=self.slide_index)
                 self._db_system_detail(df, self.instance_number[i: i+2], copied_slide,column_width_inches,tp,i)
                 k += 1
 
-    def _db_system_detail(self, df, instance_num_range, slide,column_width_inches,tp,i):
+    def _db_system_detail(self, partition, instance_num_range, slide,column_width_inches,tp,i):
 
-        list_df = []
-        for inst_num in instance_num_range:
-            inst_df = df[df['INSTANCE_NUMBER'] == inst_num]
-            list_df.append(inst_df)
+        list_df = [partition.get(inst_num) for inst_num in instance_num_range]
         preprocessed_df = self._arrange_db_system(list_df, i)
 
         SlideManager.create_text_box(slide, self.position['top_menu']['left_top_text_position'], "DB SYSTEM",
@@ -282,9 +428,10 @@ class PerformanceAnalyzer(cm.CommonModule):
     def _execute_metric(self):
 
         self.logger.info("metric.pptx")
-        df = self._convert_sql_to_df(self.sql_path, "METRIC")
-        metric_name_list = self._extract_metric_name_list()
-        num_slide, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.METRIC)
+        df = self._convert_sql_to_df(self.sql_path, "METRIC").copy()
+        self._set_df_date_time(df)
+        metric_name_list = ConfigSnapshot.metric_name_list()
+        num_slide, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.METRIC, self.slide_index)
 
         for i in range(len(metric_name_list)):
 
@@ -292,7 +439,7 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._metric_detail(target_slide, metric_name_list[i], df)
 
             else:
-                _, copied_slide = SlideManager.add_slide(self.presentation, num_slide, i)
+                _, copied_slide = SlideManager.add_slide(self.presentation, num_slide, i, slide_index=self.slide_index)
                 self._metric_detail(copied_slide, metric_name_list[i], df)
 
     def _metric_detail(self, slide, metric_name, df):
@@ -318,9 +465,7 @@ class PerformanceAnalyzer(cm.CommonModule):
                                      PerformanceAnalyzer.BASE_LINE_SPACE)
 
         metric_df = df[df["METRIC_NAME"] == metric_name]
-        copied_df = metric_df.copy()
-        preprocessed_metric_df = self._set_df_date_time(copied_df)
-        upper_chart_data, down_chart_data, upper_scale, down_scale = self._insert_chart(preprocessed_metric_df,'AG','MX')
+        upper_chart_data, down_chart_data, upper_scale, down_scale = self._insert_chart(metric_df,'AG','MX')
 
         SlideManager.set_y_axis_max_value(slide,upper_chart_data, self.position['metric']['avg_coordinate'], down_scale)
         SlideManager.set_y_axis_max_value(slide,down_chart_data, self.position['metric']['max_coordinate'], down_scale)
@@ -332,9 +477,9 @@ class PerformanceAnalyzer(cm.CommonModule):
 
         self.logger.info("RAC.pptx")
         if len(self.instance_name) != 1:
-            df = self._convert_sql_to_df(self.sql_path, "RAC")
+            df = self._convert_sql_to_df(self.sql_path, "RAC").copy()
             preprocessed_df = self._set_df_date_time(df)
-            num_slide, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.RAC)
+            num_slide, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.RAC, self.slide_index)
 
             SlideManager.create_text_box(target_slide,self.position['top_menu']['left_top_text_position'],
                                          "RAC Interconnect traffic", PerformanceAnalyzer.LARGE_FONT_SIZE,
@@ -398,8 +543,8 @@ class PerformanceAnalyzer(cm.CommonModule):
         right_tp = SlideManager.convert_inches_to_data(self.position['memory']['right_table'])
         column_width_inches = [Inches(i) for i in self.position['memory']['column_width_inches']]
 
-        shared_memory_df = self._convert_sql_to_df(self.sql_path, "MEMORY_INFO")
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.MEMORY)
+        shared_memory_df = DataFramePartition(self._convert_sql_to_df(self.sql_path, "MEMORY_INFO"), 'INST_ID')
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.MEMORY, self.slide_index)
 
         k = 1
 
@@ -410,7 +555,7 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._create_memory_blue_box(target_slide)
 
             if i >1 and i %2 ==0:
-                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k)
+                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k, slide_index=self.slide_index)
                 self._memory_detail(copied_slide, shared_memory_df, self.instance_number[i:i+2], self.instance_name[i:i+2], left_tp, right_tp, column_width_inches)
                 self._create_memory_blue_box(copied_slide)
                 k+=1
@@ -466,7 +611,7 @@ class PerformanceAnalyzer(cm.CommonModule):
 
         self.logger.info("top_schema_sql.pptx")
         top_schema_sql1 = self._convert_sql_to_df(self.sql_path, "TOP_Schema_SQL")
-        top_schema_sql2 = self._convert_sql_to_df(self.sql_path, "TOP_Schema_SQL2")
+        top_schema_sql2 = self._convert_sql_to_df(self.sql_path, "TOP_Schema_SQL2").copy()
 
         pd.set_option('display.max_columns', None)
         pd.set_option('display.max_rows', None)
@@ -476,7 +621,8 @@ class PerformanceAnalyzer(cm.CommonModule):
 
         top_schema_sql2['SQL_TEXT'] = top_schema_sql2['SQL_TEXT'].astype(str)+"..."
 
-        self._execute_top_schema_sql1(top_schema_sql1, top_schema_sql2)
+        self._execute_top_schema_sql1(DataFramePartition(top_schema_sql1, 'INSTANCE_NUMBER'),
+                                      DataFramePartition(top_schema_sql2, 'INSTANCE_NUMBER'))
 
     def _execute_top_schema_sql1(self, upper_df, down_df):
 
@@ -485,7 +631,7 @@ class PerformanceAnalyzer(cm.CommonModule):
         upper_column_width_inches = [Inches(i) for i in self.position['top_schema_sql']['table1_column_inches']]
         down_column_width_inches = [Inches(i) for i in self.position['top_schema_sql']['table2_column_inches']]
 
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TOP_SCHEMA_SQL)
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TOP_SCHEMA_SQL, self.slide_index)
 
         for i in range(len(self.instance_number)):
 
@@ -496,7 +642,7 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._detail_top_schema_sql(target_slide, upper_df, down_df, upper_tp, down_tp, upper_column_width_inches, down_column_width_inches, i)
 
             if i >= 1:
-                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, i)
+                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, i, slide_index=self.slide_index)
                 SlideManager.create_text_box(copied_slide, self.position['top_menu']['left_top_text_position'],
                                              "TOP Schema & SQL", PerformanceAnalyzer.LARGE_FONT_SIZE, PerformanceAnalyzer.FONT_NAME,
                                              PerformanceAnalyzer.BOLD_TRUE, PerformanceAnalyzer.BASE_LINE_SPACE)
@@ -531,8 +677,8 @@ class PerformanceAnalyzer(cm.CommonModule):
         right_tp = SlideManager.convert_inches_to_data(self.position['top_n']['right_table'])
         column_width_inches = [Inches(i) for i in self.position['top_n']['column_width_inches']]
 
-        top_n_df = self._convert_sql_to_df(self.sql_path, 'TOP_N_Wait_Events')
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TON_N)
+        top_n_df = DataFramePartition(self._convert_sql_to_df(self.sql_path, 'TOP_N_Wait_Events'), 'INSTANCE_NUMBER')
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TON_N, self.slide_index)
 
         k = 1
 
@@ -546,7 +692,7 @@ class PerformanceAnalyzer(cm.CommonModule):
 
             if i >1 and i%2 ==0:
 
-                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k)
+                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k, slide_index=self.slide_index)
                 SlideManager.create_text_box(copied_slide, self.position["top_menu"]["left_top_text_position"],
                                              "TOP-N Wait Events",
                                              PerformanceAnalyzer.LARGE_FONT_SIZE, PerformanceAnalyzer.FONT_NAME,
@@ -554,11 +700,11 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._top_n_wait_events_detail(copied_slide, top_n_df, self.instance_number[i:i+2], self.instance_name[i:i+2], left_tp, right_tp, column_width_inches)
                 k+=1
 
-    def _top_n_wait_events_detail(self, slide, df, instance_num_range, instance_name_range, left_tp, right_tp, column_width_inches):
+    def _top_n_wait_events_detail(self, slide, partition, instance_num_range, instance_name_range, left_tp, right_tp, column_width_inches):
 
         for i in range(len(instance_num_range)):
 
-            inst_df = df[df['INSTANCE_NUMBER'] == instance_num_range[i]]
+            inst_df = partition.get(instance_num_range[i])
             inst_num_drop_df = inst_df.drop(columns=['INSTANCE_NUMBER', 'RNK'])
 
             rec_position = self.position['top_n']['left_rectangle_position'] if self.is_even(i) else self.position['top_n']['right_rectangle_position']
@@ -577,35 +723,50 @@ class PerformanceAnalyzer(cm.CommonModule):
     def _execute_top_3_wait_events(self):
 
         self.logger.info("top_3_wait_events.pptx")
-        df = self._convert_sql_to_df(self.sql_path, "TOP_N_Wait_Events")
-        print(df)
+        df, = self._aggregate_sql_chunks(self.sql_path, "TOP_N_Wait_Events", [TopNAggregator('RNK', 4)])
+        self.logger.debug(f"TOP_N_Wait_Events top rank\n{df}")
 
         instance_dict = self._extract_top3_list(df)
-        print(instance_dict)
+        self.logger.debug(f"top 3 event: {instance_dict}")
 
         upper_tp = SlideManager.convert_inches_to_data(self.position['top_3']['upper_table'])
         down_tp = SlideManager.convert_inches_to_data(self.position['top_3']['down_table'])
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TOP_3)
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.TOP_3, self.slide_index)
+
+        top3_batch_dict = self._extract_top3_batch_dict(instance_dict)
+
+        # 고정 도형을 prototype slide 에 한 번만 그리고 나머지 slide 는 prototype 을 복제
+        self._top3_prototype(target_slide)
+        event_count = sum(len(value) for value in instance_dict.values())
+        slide_list = [target_slide] + [
+            SlideManager.clone_slide(self.presentation, slide_num, k, slide_index=self.slide_index)[1]
+            for k in range(1, event_count)
+        ]
 
         k = 0
         for indx, (key, value) in enumerate(instance_dict.items()):
 
             inst_num = key.split("_")[-1]
             for event_name in value:
-                sql1_df = self._extract_preprocessed_df(event_name, inst_num, "TOP_1_Wait_Events")
-                sql2_df = self._extract_preprocessed_df(event_name, inst_num, "TOP_2_Wait_Events", ['INSTANCE_NUMBER'])
-                sql3_df = self._extract_preprocessed_df(event_name, inst_num, "TOP_3_Wait_Events", ['INSTANCE_NUMBER'])
-                if k == 0:
-                    self._top3_detail(target_slide, event_name, self.instance_number[indx], self.instance_name[indx],
-                                      sql1_df, sql2_df, sql3_df, upper_tp, down_tp)
-                    k += 1
-
-                elif k >= 1:
-                    copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, k)
-                    self._top3_detail(copied_slide, event_name, self.instance_number[indx],self.instance_name[indx],
-                                      sql1_df, sql2_df, sql3_df, upper_tp, down_tp)
-                    k+=1
+                if top3_batch_dict is not None:
+                    sql1_df = self._split_top3_batch_df(top3_batch_dict["TOP_1_Wait_Events"], event_name, inst_num)
+                    sql2_df = self._split_top3_batch_df(top3_batch_dict["TOP_2_Wait_Events"], event_name, inst_num, ['INSTANCE_NUMBER'])
+                    sql3_df = self._split_top3_batch_df(top3_batch_dict["TOP_3_Wait_Events"], event_name, inst_num, ['INSTANCE_NUMBER'])
+
+                else:
+                    sql1_df = self._extract_preprocessed_df(event_name, inst_num, "TOP_1_Wait_Events")
+                    sql2_df = self._extract_preprocessed_df(event_name, inst_num, "TOP_2_Wait_Events", ['INSTANCE_NUMBER'])
+                    sql3_df = self._extract_preprocessed_df(event_name, inst_num, "TOP_3_Wait_Events", ['INSTANCE_NUMBER'])
+                self._top3_detail(slide_list[k], event_name, self.instance_number[indx], self.instance_name[indx],
+                                  sql1_df, sql2_df, sql3_df, upper_tp, down_tp)
+                k += 1
 
+    def _top3_prototype(self, slide):
+        """TOP-3 slide 공통 도형 (instance 배경 도형, 하단 findings)"""
+        SlideManager.create_shape(slide, MSO_AUTO_SHAPE_TYPE.ROUNDED_RECTANGLE,
+                                  self.position['top_3']['ora_rectangle_position'],
+                                  PerformanceAnalyzer.YELLOW_COLOR, PerformanceAnalyzer.YELLOW_COLOR, 0)
+        self._set_bottom_text(slide)
 
     def _top3_detail(self, slide, event_name, inst_num, inst_name, sql1_df, sql2_df, sql3_df, upper_tp, down_tp):
 
@@ -613,21 +774,17 @@ class PerformanceAnalyzer(cm.CommonModule):
                                      event_name, PerformanceAnalyzer.LARGE_FONT_SIZE, PerformanceAnalyzer.FONT_NAME,
                                      PerformanceAnalyzer.BOLD_TRUE, PerformanceAnalyzer.BASE_LINE_SPACE)
 
-        SlideManager.create_shape(slide, MSO_AUTO_SHAPE_TYPE.ROUNDED_RECTANGLE,
-                                  self.position['top_3']['ora_rectangle_position'],
-                                  PerformanceAnalyzer.YELLOW_COLOR, PerformanceAnalyzer.YELLOW_COLOR, 0)
-
         SlideManager.create_text_box(slide, self.position['top_3']['ora_position'],
                                      inst_name, PerformanceAnalyzer.DEFAULT_FONT_SIZE,
                                      PerformanceAnalyzer.FONT_NAME, PerformanceAnalyzer.BOLD_TRUE,
                                      PerformanceAnalyzer.BASE_LINE_SPACE)
 
-        chart_data, chart_scale = SlideManager.insert_chart(sql1_df, 'DATE_TIME', 'VALPSEC', inst_name)
+        max_points, method, _ = ChartDownsampler.get_option(ConfigSnapshot.get("report"))
+        chart_data, chart_scale = SlideManager.insert_chart(sql1_df, 'DATE_TIME', 'VALPSEC', inst_name, max_points, method)
         SlideManager.set_y_axis_max_value(slide, chart_data, self.position['top_3']['chart_position'], chart_scale)
         self._top3_chart_detail(slide, inst_num)
         SlideManager.make_table(sql2_df, upper_tp, slide)
         SlideManager.make_table(sql3_df, down_tp, slide)
-        self._set_bottom_text(slide)
 
 
 
@@ -672,7 +829,7 @@ class PerformanceAnalyzer(cm.CommonModule):
     def _execute_literal_sql(self):
 
         self.logger.info("literalsql.pptx")
-        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.LITERAL_SQL)
+        slide_num, target_slide = SlideManager.read_slide(self.presentation.slides, PerformanceAnalyzer.LITERAL_SQL, self.slide_index)
         column_width_inches = [Inches(i) for i in self.position['literal_sql']['column_width_inches']]
         tp = SlideManager.convert_inches_to_data(self.position['literal_sql']['table_position'])
 
@@ -682,7 +839,7 @@ class PerformanceAnalyzer(cm.CommonModule):
                 self._literal_sql_detail(target_slide, tp, column_width_inches, self.instance_number[i], self.instance_name[i])
 
             if i >= 1:
-                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, i)
+                copied_num, copied_slide = SlideManager.add_slide(self.presentation, slide_num, i, slide_index=self.slide_index)
                 self._literal_sql_detail(copied_slide, tp, column_width_inches,self.instance_number[i], self.instance_name[i])
 
     def _literal_sql_detail(self, slide, tp, column_width_inches, inst_num, instance_name):
@@ -733,8 +890,7 @@ class PerformanceAnalyzer(cm.CommonModule):
     def _extract_top3_list(self, df):
 
         instance_dict = {}
-        for instance_num in df["INSTANCE_NUMBER"].unique():
-            instance_num_df = df[df["INSTANCE_NUMBER"] == instance_num]
+        for instance_num, instance_num_df in DataFramePartition(df, "INSTANCE_NUMBER").items():
             top_3_df = instance_num_df.iloc[1:4]
             top3_3_name = list(top_3_df['EVENT_NAME'])
             instance_num_name = f"instance_{instance_num}"
@@ -744,7 +900,7 @@ class PerformanceAnalyzer(cm.CommonModule):
 
     def _extract_preprocessed_df(self,event_name, instance_num, sql_filename, except_col=[]):
 
-        df = self._convert_sql_to_df(self.sql_path, sql_filename, event_name)
+        df = self._convert_sql_to_df(self.sql_path, sql_filename, event_name).copy()
         preprocessed_df = self._set_df_date_time(df)
         event_name_df = preprocessed_df[preprocessed_df['INSTANCE_NUMBER'] == int(instance_num)]
         event_name_df = event_name_df.drop(columns=except_col)
@@ -753,6 +909,61 @@ class PerformanceAnalyzer(cm.CommonModule):
             event_name_df = pd.DataFrame(0, index=range(3), columns=event_name_df.columns)
         return event_name_df
 
+    def _extract_top3_batch_dict(self, instance_dict):
+        """
+        전용 batch sql(TOP_1/2/3_Wait_Events_BATCH.txt) 을 전체 top event 목록으로 한 번씩만 실행하고
+        결과를 (EVENT_NAME, INSTANCE_NUMBER) 기준으로 분리한다.
+        batch sql 은 EVENT_NAME IN (#(EVENT_NAME)) 조건에 순위 / 집계를 EVENT_NAME 별로(PARTITION BY EVENT_NAME) 계산하고
+        event 별 sql 과 같은 컬럼(EVENT_NAME 포함)을 반환해야 한다.
+        batch sql 이 없거나 결과에 EVENT_NAME 컬럼이 없으면 None 을 반환하고 event 별 조회 방식을 사용한다.
+        """
+        event_name_list = []
+        for value in instance_dict.values():
+            for event_name in value:
+                if event_name not in event_name_list:
+                    event_name_list.append(event_name)
+
+        if not event_name_list:
+            return None
+
+        sql_engine = SqlTemplateEngine.get(self.sql_path, ConfigSnapshot.get("report"))
+        batch_filename_list = [f"{sql_filename}{PerformanceAnalyzer.BATCH_SQL_SUFFIX}"
+                               for sql_filename in PerformanceAnalyzer.TOP_3_SQL_LIST]
+
+        if not all(sql_engine.has(batch_filename) for batch_filename in batch_filename_list):
+            return None
+
+        date_dict = self._make_date_dict(tuple(event_name_list))
+
+        top3_batch_dict = {}
+        for sql_filename, batch_filename in zip(PerformanceAnalyzer.TOP_3_SQL_LIST, batch_filename_list):
+            with self.timer.stage("query", batch_filename) as record:
+                df = QueryStreamUtils.concat_chunks(sql_engine.prepare(batch_filename, date_dict).fetch(self.ot))
+                record.set_frame(df)
+
+            if df is None or 'EVENT_NAME' not in df.columns:
+                self.logger.debug(f"{batch_filename} result has no EVENT_NAME, query by event")
+                return None
+
+            preprocessed_df = self._set_df_date_time(df.fillna(0))
+            top3_batch_dict[sql_filename] = {
+                key: group for key, group in preprocessed_df.groupby(['EVENT_NAME', 'INSTANCE_NUMBER'], sort=False)
+            }
+
+        return top3_batch_dict
+
+    def _split_top3_batch_df(self, group_dict, event_name, instance_num, except_col=[]):
+
+        """batch 결과에서 event / instance 부분 (_extract_preprocessed_df 와 같은 컬럼)"""
+        event_name_df = group_dict.get((event_name, int(instance_num)))
+
+        if event_name_df is None:
+            columns = next(iter(group_dict.values())).columns if group_dict else []
+            columns = [col for col in columns if col not in except_col]
+            return pd.DataFrame(0, index=range(3), columns=columns)
+
+        return event_name_df.drop(columns=except_col)
+
     def _set_bottom_text(self, copied_slide):
 
         bottom_text = "RAC 의 경우 Fail CPU 사용률은 1,2번 모두 30% 이하로 안정적이며 특정 이벤트 및 I/O 급증으로 인한 CPU 증가 현상은 없습니다.\n" \
@@ -795,24 +1006,23 @@ class PerformanceAnalyzer(cm.CommonModule):
                                             PerformanceAnalyzer.WHILE_COLOR)
     def _insert_chart(self, df,col1,col2):
 
-        upper_chart_data = CategoryChartData()
-        down_chart_data = CategoryChartData()
+        # chart scale 은 downsampling(lttb 는 최대값을 버릴 수 있음) 전 전체 데이터의 instance 별 max 로 계산
+        scale_df = df.groupby('INSTANCE_NUMBER')[[col1, col2]].max()
 
-        upper_max_list = []
-        down_max_list = []
+        upper_max_list = scale_df[col1].tolist()
+        down_max_list = scale_df[col2].tolist()
 
-        for idx, instance_num in enumerate(df['INSTANCE_NUMBER'].unique()):
-            extract_df = df[df['INSTANCE_NUMBER'] == instance_num]
-            chart_categories = extract_df['DATE_TIME'].tolist()
+        max_points, method, _ = ChartDownsampler.get_option(ConfigSnapshot.get("report"))
+        df = ChartDownsampler.downsample_df(df, [col1, col2], max_points, method, 'INSTANCE_NUMBER', 'DATE_TIME')
 
-            upper_max_score = extract_df[col1].max()
-            down_max_score = extract_df[col2].max()
+        upper_chart_data = CategoryChartData()
+        down_chart_data = CategoryChartData()
 
-            upper_col_tuple = tuple(extract_df[col1].tolist())
-            down_col_tuple = tuple(extract_df[col2].tolist())
+        for idx, (instance_num, extract_df) in enumerate(DataFramePartition(df, 'INSTANCE_NUMBER').items()):
+            chart_categories = extract_df['DATE_TIME'].to_numpy()
 
-            upper_max_list.append(upper_max_score)
-            down_max_list.append(down_max_score)
+            upper_col_tuple = extract_df[col1].to_numpy()
+            down_col_tuple = extract_df[col2].to_numpy()
 
             upper_chart_data.categories = chart_categories
             upper_chart_data.add_series(f'ORCLDB_{instance_num}',upper_col_tuple)
@@ -827,11 +1037,7 @@ class PerformanceAnalyzer(cm.CommonModule):
 
     def _set_df_date_time(self, df):
 
-        if 'DATE_TIME' in df.columns:
-            df["DATE_TIME"] = df["DATE_TIME"].astype(str) + ":00"
-            df["DATE_TIME"] = df["DATE_TIME"].apply(lambda x: "\n".join(x.split()))
-
-        return df
+        return DateTimeLabelFormatter.apply(df)
 
 
 
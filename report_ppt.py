@@ -1,21 +1,21 @@
-import copy
+import os
+import tempfile
 
 from src import common_module as cm
 from src.common.constants import SystemConstants, DbTypeConstants
-from src.common.utils import DateUtils, SystemUtils, SqlUtils
+from src.common.utils import DateUtils, SystemUtils
 from src.analysis_extend_target import OracleTarget
+from src.common.report_utils import ConfigSnapshot, QueryCache, QueryStreamUtils, SqlTemplateEngine, DataFramePartition, TargetFanOut, \
+    LocalColumnarStore, StageTimer, DateTimeLabelFormatter
+from src.ppt.ppt_writer import SlideManager
 
 import pandas as pd
 
-from resources.config_manager import Config
-
 from pptx import Presentation
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 from pptx.util import Pt
 from pptx.table import Table, _Row, _Cell
 from copy import deepcopy
-from pptx.enum.chart import XL_CHART_TYPE
-from pptx.chart.data import CategoryChartData
 
 
 class ReportPpt(cm.CommonModule):
@@ -24,13 +24,62 @@ class ReportPpt(cm.CommonModule):
         super().__init__(logger=logger)
         self.ot: OracleTarget = None
         self.presentiton_path = 'report10.pptx'
-        self.presentation = Presentation(self.presentiton_path)
+        self._presentation = None
+        self.output_path = '231023_5.pptx'
+        self.atomic_save = True
+        self.timer = StageTimer("ReportPpt")
 
     def main_process(self):
 
         self.logger.info("Report PPT")
-        self._insert_extend_target_data()
-        self._check_filename()
+
+        if TargetFanOut.is_fan_out(self.config):
+            TargetFanOut.run(ReportPpt, self.config, self.logger)
+            return
+
+        self.output_path = TargetFanOut.make_target_path(self.config, self.output_path)
+
+        with self.timer.stage("connect"):
+            self._insert_extend_target_data()
+
+        try:
+            self._check_filename()
+
+            with self.timer.stage("save", self.output_path):
+                self._save_presentation()
+
+        finally:
+            self.timer.report(self.logger, ConfigSnapshot.get("report"), self.config.get(TargetFanOut.TARGET_NAME_KEY))
+
+    @property
+    def presentation(self):
+        """slide 를 실제로 생성할 때 template load"""
+        if self._presentation is None:
+            self._presentation = Presentation(self.presentiton_path)
+        return self._presentation
+
+    def _save_presentation(self):
+        """
+        table / slide 변경 사항을 모두 반영한 뒤 presentation 을 한 번만 저장
+        atomic_save 이면 같은 경로의 임시 파일에 저장 후 rename
+        """
+        if self._presentation is None:
+            return
+
+        if not self.atomic_save:
+            self.presentation.save(self.output_path)
+            return
+
+        output_dir = os.path.dirname(os.path.abspath(self.output_path))
+        fd, tmp_path = tempfile.mkstemp(suffix=".pptx", dir=output_dir)
+        os.close(fd)
+
+        try:
+            self.presentation.save(tmp_path)
+            os.replace(tmp_path, self.output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def _insert_extend_target_data(self):
         """
@@ -48,52 +97,39 @@ class ReportPpt(cm.CommonModule):
                 self.ot.set_extend_target_config(extend_target_repo)
                 self.ot.init_process()
 
-    def _extract_metric_name_list(self):
-
-        metric_name_list = [
-            "Host CPU Utilization (%)",
-            "Average Active Sessions",
-            "Executions Per Sec",
-            "User Transaction Per Sec",
-            "Logical Reads Per Sec",
-            "Physical Reads Per Sec",
-            "Hard Parse Count Per Sec",
-        ]
-
-        config_report = Config("report").get_config()
-        metric_name_list.extend(config_report["sys_metric"])
-
-        return metric_name_list
-
 
     def _convert_sql_to_df(self, sql_path, filename):
         """
         sql query문을 dataframe 형태로 변환
         """
-        metric_name_list = self._extract_metric_name_list()
-        unpack_metric_name_list = str(metric_name_list)[1:-1]
-
         s_date, e_date = DateUtils.get_each_date_by_interval2(
             self.config["args"]["s_date"], self.config["args"]["interval"], arg_fmt="%Y-%m-%d"
         )
-        date_dict = {"StartDate": s_date, "EndDate": e_date, "Metric_Name": unpack_metric_name_list}
+        date_dict = {"StartDate": s_date, "EndDate": e_date, "Metric_Name": ConfigSnapshot.metric_name_list()}
+
+        config_report = ConfigSnapshot.get("report")
+        sql_engine = SqlTemplateEngine.get(sql_path, config_report)
+        prepared_sql = sql_engine.prepare(filename, date_dict)
+
+        query_cache = QueryCache.from_config(config_report, self.config)
+        cached_df = query_cache.get(filename, prepared_sql.cache_text)
 
-        query = SystemUtils.get_file_content_in_path(sql_path, filename + ".txt")
-        date_query = SqlUtils.sql_replace_to_dict(query, date_dict)
+        if cached_df is not None:
+            return cached_df
 
-        for df in self.ot.get_data_by_query(date_query):
-            df.columns = [i.upper() for i in df.columns]
-            return df
+        local_store = LocalColumnarStore.from_config(config_report, self.config)
+
+        with self.timer.stage("query", filename) as record:
+            df = QueryStreamUtils.fetch_df(sql_engine, filename, date_dict, self.ot, local_store)
+            record.set_frame(df)
+        query_cache.put(filename, prepared_sql.cache_text, df)
+        return df
 
     def _extract_instance_num_df(self, df, category_name):
         """
         instance_num dataframe 추출
         """
-        instance_num_df_list =[]
-        for instance_num in df[category_name].unique():
-            instance_num_df = df[df[category_name] == instance_num]
-            instance_num_df_list.append(instance_num_df)
-        return instance_num_df_list
+        return DataFramePartition(df, category_name).values()
 
     def _check_filename(self):
 
@@ -103,38 +139,49 @@ class ReportPpt(cm.CommonModule):
         for file in txt_file_list:
             filename = file.split(".")[0]
 
-            if filename == "TOP_N_Wait_Events":
-                df = self._convert_sql_to_df(sql_path, filename)
-                self._extract_table_data_in_ppt(df, 'TOP-N Wait Events', 'INSTANCE_NUMBER')
+            with self.timer.stage("section", filename):
+                self._check_file_section(sql_path, filename)
+
+    def _check_file_section(self, sql_path, filename):
+        if filename == "TOP_N_Wait_Events":
+            df = self._convert_sql_to_df(sql_path, filename)
+            self._extract_table_data_in_ppt(df, 'TOP-N Wait Events', 'INSTANCE_NUMBER')
+
+        if filename == "TOP_1_Wait_Events":
+            df = self._convert_sql_to_df(sql_path, filename)
+            self._extract_table_data_in_ppt2(df, 'TOP Wait Events – log file sync', 'INSTANCE_NUMBER')
 
-            if filename == "TOP_1_Wait_Events":
-                df = self._convert_sql_to_df(sql_path, filename)
-                self._extract_table_data_in_ppt2(df, 'TOP Wait Events – log file sync', 'INSTANCE_NUMBER')
+        # if filename == "TOP_2_Wait_Events":
+        #     df = self._convert_sql_to_df(sql_path, filename)
+        #     self._extract_table_data_in_ppt2(df, 'TOP Wait Events – log file sync')
 
-            # if filename == "TOP_2_Wait_Events":
-            #     df = self._convert_sql_to_df(sql_path, filename)
-            #     self._extract_table_data_in_ppt2(df, 'TOP Wait Events – log file sync')
+        # if filename == "TOP_1_Schema_SQL":
+        #     df = self._convert_sql_to_df(sql_path,filename)
+        #     self._extract_table_data_in_ppt2(df, 'TOP Schema & SQL')
 
-            # if filename == "TOP_1_Schema_SQL":
-            #     df = self._convert_sql_to_df(sql_path,filename)
-            #     self._extract_table_data_in_ppt2(df, 'TOP Schema & SQL')
+        if filename == "Literal_SQL":
+            df = self._convert_sql_to_df(sql_path,filename)
+            self._extract_table_data(df, '성능 분석 – Literal SQL 점검')
 
-            if filename == "Literal_SQL":
-                df = self._convert_sql_to_df(sql_path,filename)
-                self._extract_table_data(df, '성능 분석 – Literal SQL 점검')
+        # instance 별 chart slide: report config chart_slide_dict {sql 파일명: slide 제목 text}
+        chart_slide_text = ConfigSnapshot.get("report").get("chart_slide_dict", {}).get(filename)
+
+        if chart_slide_text is not None:
+            df = self._convert_sql_to_df(sql_path, filename)
+            self._check_instance_num_and_slide_num(df, chart_slide_text)
 
     def _extract_table_data(self, df, text_frame_text):
 
         df_list=[]
         df_list.append(df)
-        print('df_list',df_list)
+        self.logger.debug(f"df_list {df_list}")
 
         for idx, slide in enumerate(self.presentation.slides):
             for shape in slide.shapes:
                 if shape.shape_type == MSO_SHAPE_TYPE.TEXT_BOX and shape.text_frame.text == text_frame_text:
                     ppt_df_list = self._extract_ppt_df(slide)
                     result_list = self._compare_data(df_list, ppt_df_list)
-                    print('result_list',result_list)
+                    self.logger.debug(f"result_list {result_list}")
                     shape_list = self._extract_shape_list(slide, mso_type=MSO_SHAPE_TYPE.TABLE)
                     self._insert_data_into_ppt_table(shape_list, result_list)
 
@@ -197,8 +244,12 @@ class ReportPpt(cm.CommonModule):
                     shape_list = self._extract_shape_list(slide, mso_type=MSO_SHAPE_TYPE.TABLE)
                     self._insert_data_into_ppt_table(shape_list, result_list)
 
-    def _check_instance_num_and_slide_num(self,df,text_frame_text):
-        instance_df_list = self._extract_instance_num_df(df)
+    def _check_instance_num_and_slide_num(self,df,text_frame_text, cn='INSTANCE_NUMBER'):
+        """
+        text_frame_text 제목 slide 의 chart 를 instance 별 데이터로 교체
+        slide 가 부족하면 마지막 slide 를 복제하고, 남으면 뒤에서부터 삭제한다.
+        """
+        instance_df_list = self._extract_instance_num_df(df, category_name=cn)
         slide_list = []
 
         for idx, slide in enumerate(self.presentation.slides):
@@ -207,70 +258,29 @@ class ReportPpt(cm.CommonModule):
                     result_tuple = (idx, slide)
                     slide_list.append(result_tuple)
 
-        if len(instance_df_list) == len(slide_list):
-            print("slide 같음")
-            self._insert_data_into_ppt2(df,slide_list)
-
-        if len(instance_df_list) > len(slide_list):
-            print("slide 추가")
-
-            for idx, slide in slide_list:
-                source_slide = self.presentation.slides[idx] # 복사하려는 슬라이드 정의
-                slide_layout = source_slide.slide_layout
-                copied_slide = self.presentation.slides.add_slide(slide_layout)
-
-                title = copied_slide.placeholders[0]
-                sp_title = title.element
-                sp_title.getparent().remove(sp_title)
-
-                subtitle = copied_slide.placeholders[1]
-                sp = subtitle.element
-                sp.getparent().remove(sp)
+        if not slide_list:
+            self.logger.warning(f"'{text_frame_text}' slide 없음")
+            return
 
-                for shape in source_slide.shapes:
-                    if shape.has_chart:  # Check if the shape is a chart/graph
+        for (_, slide), instance_df in zip(slide_list, instance_df_list):
+            self._replace_chart_cache(slide, instance_df, cn)
 
-                        original_chart = shape.chart
-                        category_labels = [c.label for c in original_chart.plots[0].categories]
-
-                        chart_data = CategoryChartData()
-
-                        for i, series in enumerate(original_chart.plots[0].series):
-                            print(series.values)
-                            chart_data.categories = category_labels
-                            chart_data.add_series(series.name,series.values)
-
-                        new_chart = copied_slide.shapes.add_chart(
-                            XL_CHART_TYPE.LINE,
-                            shape.left,
-                            shape.top,
-                            shape.width,
-                            shape.height,
-                            chart_data
-                        )
-
-                        new_chart.chart_style = original_chart.chart_style
-
-                        # print("chart???", shape.chart)
-                        # print(shape.shape_id)
-                        # new_chart = copy.deepcopy(shape.chart)
-                        # copied_slide.shapes._spTree.insert_element_before(new_chart.element, 'p:extLst')
-                        # Handle chart copying manually
+        if len(instance_df_list) == len(slide_list):
+            self.logger.debug("slide 같음")
 
-                    else:
-                        # 차트를 제외한 데이터 copy
-                        el = shape.element
-                        newel = copy.deepcopy(el)
-                        copied_slide.shapes._spTree.insert_element_before(newel, 'p:extLst')
+        if len(instance_df_list) > len(slide_list):
+            self.logger.debug("slide 추가")
 
-                self.presentation.slides._sldIdLst.insert(idx + 1, self.presentation.slides._sldIdLst[-1])
-                del self.presentation.slides._sldIdLst[-1]
+            # 마지막 slide 를 chart part / workbook 까지 그대로 복제하고 series cache 만 교체
+            last_idx, _ = slide_list[-1]
 
-            self.presentation.save('plfi2.pptx')
+            for k, instance_df in enumerate(instance_df_list[len(slide_list):], start=1):
+                copied_idx, copied_slide = SlideManager.clone_slide(self.presentation, last_idx, k)
+                self._replace_chart_cache(copied_slide, instance_df, cn)
 
 
         if len(instance_df_list) < len(slide_list):
-            print(f"instance_df_list 개수: {len(instance_df_list)}, slide_list 개수 :{len(slide_list)}")
+            self.logger.debug(f"instance_df_list 개수: {len(instance_df_list)}, slide_list 개수 :{len(slide_list)}")
             remove_count = len(slide_list)-len(instance_df_list)
             xml_slides = self.presentation.slides._sldIdLst
             first_number = slide_list[0][0]
@@ -280,15 +290,46 @@ class ReportPpt(cm.CommonModule):
             remove_indices = [idx for idx in range(len(slide_list) - 1, len(slide_list) - 1 - remove_count, -1)]
 
             for idx in remove_indices:
-                print(slides[idx])
+                self.logger.debug(slides[idx])
                 xml_slides.remove(slides[idx])
-            self.presentation.save(f'delete_slide_{remove_count}.pptx')
+
+    def _replace_chart_cache(self, slide, instance_df, cn='INSTANCE_NUMBER'):
+        """
+        slide chart 의 category(DATE_TIME label) / series cache 를 instance 데이터로 교체
+        대응되는 값 컬럼이 없는 chart 는 prototype 값을 그대로 두고 warning 을 남긴다.
+        """
+        categories = DateTimeLabelFormatter.format(instance_df['DATE_TIME']) if 'DATE_TIME' in instance_df.columns else None
+        value_col_list = [col for col in instance_df.columns if col not in ('DATE_TIME', cn)]
+
+        for shape in slide.shapes:
+            if not shape.has_chart:
+                continue
+
+            series_name_list = [series.name for series in shape.chart.series]
+            series_col_dict = self._map_series_to_columns(series_name_list, value_col_list)
+            series_value_dict = {name: instance_df[col].to_numpy() for name, col in series_col_dict.items()}
+
+            if SlideManager.replace_series_cache(shape.chart, categories, series_value_dict) == 0:
+                self.logger.warning(f"chart series {series_name_list} 와 대응되는 컬럼이 없음 {value_col_list}, prototype 값 유지")
+
+    @staticmethod
+    def _map_series_to_columns(series_name_list, value_col_list):
+        """
+        series 이름 -> 값 컬럼
+        이름이 같은 컬럼을 우선 사용하고, 하나도 없으면서 개수가 같으면 순서대로 대응시킨다.
+        """
+        series_col_dict = {name: name for name in series_name_list if name in value_col_list}
+
+        if not series_col_dict and len(series_name_list) == len(value_col_list):
+            series_col_dict = dict(zip(series_name_list, value_col_list))
+
+        return series_col_dict
 
     def _insert_data_into_ppt_table(self, shape_list, result_list):
         """
 
         """
-        print(shape_list, result_list)
+        self.logger.debug(f"{shape_list} {result_list}")
         for shape, result in zip(shape_list, result_list):
             row_count = len(shape.table.rows)
 
@@ -303,11 +344,9 @@ class ReportPpt(cm.CommonModule):
                                 run.font.size = Pt(8)
 
                 if row_index + 1 >= row_count:
-                    print("eeeeeeeeee", row_index, row_data, shape.table)
+                    self.logger.debug(f"add row {row_index} {row_data} {shape.table}")
                     self.add_row(shape.table, row_data)
 
-            self.presentation.save('231023_5.pptx')
-
     def add_row(self, table:Table, row_data) -> _Row:
         """
 
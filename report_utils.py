@@ -0,0 +1,1330 @@
+import copy
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from openpyxl import Workbook, load_workbook
+
+from resources.config_manager import Config
+
+
+class ConfigSnapshot:
+    """
+    Config(name).get_config() 결과를 process 내에서 공유하는 snapshot
+    config 파일 mtime 이 바뀌면 다시 읽고, metric name list 등
+    config 로부터 만든 값도 snapshot 단위로 memoize 한다.
+    """
+
+    BASE_METRIC_NAME_LIST = (
+        "Host CPU Utilization (%)",
+        "Average Active Sessions",
+        "Executions Per Sec",
+        "User Transaction Per Sec",
+        "Logical Reads Per Sec",
+        "Physical Reads Per Sec",
+        "Hard Parse Count Per Sec",
+    )
+
+    CHECK_INTERVAL = 1.0  # config 파일 mtime 확인 간격(초)
+
+    _snapshot_dict = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def get(cls, name):
+        """
+        name config 반환 (호출 측에서 수정하지 않는다)
+        """
+        return cls._get_entry(name)["config"]
+
+    @classmethod
+    def metric_name_list(cls):
+        """기본 metric + report config 의 sys_metric"""
+        return list(cls._derive("report", "metric_name_list",
+                                lambda config: cls.BASE_METRIC_NAME_LIST + tuple(config["sys_metric"])))
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._snapshot_dict.clear()
+
+    @classmethod
+    def _derive(cls, name, key, func):
+        with cls._lock:
+            derived_dict = cls._get_entry(name)["derived"]
+
+            if key not in derived_dict:
+                derived_dict[key] = func(cls.get(name))
+
+            return derived_dict[key]
+
+    @classmethod
+    def _get_entry(cls, name):
+        with cls._lock:
+            entry = cls._snapshot_dict.get(name)
+            now = time.monotonic()
+
+            if entry is not None and now - entry["checked"] < cls.CHECK_INTERVAL:
+                return entry
+
+            path = entry["path"] if entry is not None else cls._find_config_file(name)
+            mtime = cls._get_mtime(path)
+
+            if entry is None or mtime != entry["mtime"]:
+                entry = {"config": Config(name).get_config(), "path": path, "mtime": mtime, "derived": {}}
+                cls._snapshot_dict[name] = entry
+
+            entry["checked"] = now
+            return entry
+
+    @staticmethod
+    def _find_config_file(name):
+        """
+        config_manager 모듈 폴더 아래에서 "{name}.*" config 파일 탐색 (없으면 None -> 최초 1회만 load)
+        """
+        module_file = getattr(sys.modules.get(Config.__module__), "__file__", None)
+
+        if module_file is None:
+            return None
+
+        pattern = os.path.join(os.path.dirname(os.path.abspath(module_file)), "**", f"{name}.*")
+        file_list = [f for f in glob.glob(pattern, recursive=True) if not f.endswith((".py", ".pyc"))]
+        return sorted(file_list)[0] if file_list else None
+
+    @staticmethod
+    def _get_mtime(path):
+        if path is None:
+            return None
+
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+
+class StageRecord:
+    """StageTimer.stage 블록 하나의 측정 결과"""
+
+    def __init__(self, stage, name):
+        self.stage = stage
+        self.name = name
+        self.elapsed = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+    def set_frame(self, df):
+        """처리한 dataframe 의 row 수 / 메모리 크기(object 컬럼은 참조 크기만) 기록"""
+        if df is not None:
+            self.rows += len(df)
+            self.bytes += int(df.memory_usage(index=False).sum())
+
+    def to_dict(self):
+        return {"stage": self.stage, "name": self.name, "elapsed": round(self.elapsed, 4),
+                "rows": self.rows, "bytes": self.bytes}
+
+
+class StageTimer:
+    """
+    report 생성 단계(query / preprocess / section / save 등) 별 소요 시간, row 수, byte 수 기록
+    with timer.stage("query", filename) as record:
+        df = ...
+        record.set_frame(df)
+    main_process 종료 시 report() 로 요약 table 을 log 에 남기고
+    report config 의 stage_timer.path 가 있으면 json 으로 저장한다.
+    """
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self.record_list = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage, name=""):
+        record = StageRecord(stage, name)
+        start = time.perf_counter()
+
+        try:
+            yield record
+
+        finally:
+            record.elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self.record_list.append(record)
+
+    def summary_df(self):
+        """(stage, name) 별 합계 (소요 시간 내림차순)"""
+        columns = ["stage", "name", "count", "elapsed", "rows", "bytes"]
+
+        if not self.record_list:
+            return pd.DataFrame(columns=columns)
+
+        record_df = pd.DataFrame([record.to_dict() for record in self.record_list])
+        summary_df = record_df.groupby(["stage", "name"], sort=False).agg(
+            count=("elapsed", "size"), elapsed=("elapsed", "sum"), rows=("rows", "sum"), bytes=("bytes", "sum")
+        ).reset_index()
+
+        summary_df["elapsed"] = summary_df["elapsed"].round(4)
+        return summary_df[columns].sort_values("elapsed", ascending=False, ignore_index=True)
+
+    def report(self, logger, config_report=None, target_name=None):
+        summary_df = self.summary_df()
+        logger.info(f"{self.module_name} stage timing\n{summary_df.to_string(index=False)}")
+
+        json_path = (config_report or {}).get("stage_timer", {}).get("path")
+
+        if not json_path:
+            return summary_df
+
+        os.makedirs(json_path, exist_ok=True)
+        file_name = "_".join(
+            filter(None, [self.module_name, target_name, datetime.now().strftime("%Y%m%d%H%M%S")])
+        )
+
+        with open(os.path.join(json_path, f"{file_name}.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "module": self.module_name,
+                "target": target_name,
+                "records": [record.to_dict() for record in self.record_list],
+                "summary": summary_df.to_dict(orient="records"),
+            }, f, ensure_ascii=False, indent=2, default=str)
+
+        return summary_df
+
+
+class TargetFanOut:
+    """
+    extend_target_repo 가 여러 개이면 target DB 마다 별도 process 에서 report 모듈 실행
+    process 별로 target 1개만 담긴 config 복사본, 전용 log 파일, target 이름이 붙은 output 경로를 사용한다.
+    report config(fan_out): {"enable": true, "max_processes": 4, "log_path": "..."} (enable 기본값 false)
+    """
+
+    DEFAULT_MAX_PROCESSES = 4
+    TARGET_NAME_KEY = "target_name"
+    LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+    @staticmethod
+    def is_fan_out(config):
+        """이미 target 별 process 이거나 target 이 1개 이하면 False"""
+        if TargetFanOut.TARGET_NAME_KEY in config:
+            return False
+
+        if not ConfigSnapshot.get("report").get("fan_out", {}).get("enable", False):
+            return False
+
+        return len(config["maxgauge_repo"].get("extend_target_repo", [])) > 1
+
+    @staticmethod
+    def run(module_cls, config, logger):
+        """
+        target 별 process 실행 후 완료 / 실패 target 이름 반환
+        실패한 target 이 있으면 target 별 log 파일 위치와 함께 error 요약을 남긴다.
+        """
+        fan_out_config = ConfigSnapshot.get("report").get("fan_out", {})
+        max_processes = fan_out_config.get("max_processes", TargetFanOut.DEFAULT_MAX_PROCESSES)
+        log_path = fan_out_config.get("log_path") or os.path.join(config["home"], "logs", "fan_out")
+        os.makedirs(log_path, exist_ok=True)
+
+        target_config_list = TargetFanOut.make_target_config_list(config)
+        done_list, fail_list = [], []
+
+        with ProcessPoolExecutor(max_workers=min(max_processes, len(target_config_list))) as executor:
+            future_dict = {
+                executor.submit(TargetFanOut._run_target, module_cls, target_config, log_path):
+                    target_config[TargetFanOut.TARGET_NAME_KEY]
+                for target_config in target_config_list
+            }
+
+            for future in as_completed(future_dict):
+                target_name = future_dict[future]
+
+                try:
+                    future.result()
+                    done_list.append(target_name)
+                    logger.info(f"{module_cls.__name__} {target_name} done")
+
+                except Exception as e:
+                    fail_list.append(target_name)
+                    logger.error(f"{module_cls.__name__} {target_name} failed: {e}")
+
+        if fail_list:
+            logger.error(f"{module_cls.__name__} fan out failed {len(fail_list)}/{len(target_config_list)} target: "
+                         f"{', '.join(fail_list)} (log: {log_path})")
+
+        return done_list, fail_list
+
+    @staticmethod
+    def make_target_config_list(config):
+        target_config_list = []
+        name_set = set()
+
+        for idx, extend_target_repo in enumerate(config["maxgauge_repo"].get("extend_target_repo", [])):
+            target_config = copy.deepcopy(config)
+            target_config["maxgauge_repo"]["extend_target_repo"] = [target_config["maxgauge_repo"]["extend_target_repo"][idx]]
+
+            target_name = TargetFanOut._make_target_name(extend_target_repo, idx)
+            if target_name in name_set:
+                target_name = f"{target_name}_{idx}"
+            name_set.add(target_name)
+
+            target_config[TargetFanOut.TARGET_NAME_KEY] = target_name
+            target_config_list.append(target_config)
+
+        return target_config_list
+
+    @staticmethod
+    def make_target_path(config, path):
+        """
+        target 별 process 이면 파일명 뒤에 target 이름을 붙인 경로 반환 (report.pptx -> report_{target}.pptx)
+        """
+        target_name = config.get(TargetFanOut.TARGET_NAME_KEY)
+
+        if target_name is None:
+            return path
+
+        root, ext = os.path.splitext(path)
+        return f"{root}_{target_name}{ext}"
+
+    @staticmethod
+    def get_target_name(config):
+        """
+        config 가 조회하는 target 식별 이름 (target 별 process 이면 target_name, 아니면 extend_target_repo 이름 목록)
+        """
+        if TargetFanOut.TARGET_NAME_KEY in config:
+            return config[TargetFanOut.TARGET_NAME_KEY]
+
+        extend_target_repo_list = config.get("maxgauge_repo", {}).get("extend_target_repo", [])
+        target_name_list = [TargetFanOut._make_target_name(extend_target_repo, idx)
+                            for idx, extend_target_repo in enumerate(extend_target_repo_list)]
+
+        return "_".join(target_name_list) or "default"
+
+    @staticmethod
+    def _make_target_name(extend_target_repo, idx):
+        name_key_list = ("target_name", "name", "sid", "service_name", "host")
+        target_name = next((extend_target_repo[key] for key in name_key_list if extend_target_repo.get(key)), None)
+
+        if target_name is None:
+            return f"target_{idx}"
+
+        return re.sub(r"[^\w.-]", "_", str(target_name))
+
+    @staticmethod
+    def _run_target(module_cls, config, log_path):
+        """worker process: target 전용 logger 로 모듈 main_process 실행"""
+        target_name = config[TargetFanOut.TARGET_NAME_KEY]
+        logger = logging.getLogger(f"{module_cls.__name__}.{target_name}")
+        logger.setLevel(logging.DEBUG)
+
+        handler = logging.FileHandler(os.path.join(log_path, f"{module_cls.__name__}_{target_name}.log"), encoding="utf-8")
+        handler.setFormatter(logging.Formatter(TargetFanOut.LOG_FORMAT))
+        logger.addHandler(handler)
+
+        try:
+            module = module_cls(logger)
+            module.config = config
+            module.main_process()
+
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+
+class QueryCache:
+    """
+    sql 파일명 + 값이 치환된 query 기준 조회 결과 cache
+    메모리(LRU) 와 선택적인 parquet 디스크 layer 로 구성되며 TTL / 개수 기준으로 제거한다.
+    같은 sql 이라도 target DB 마다 결과가 다르므로 target 별 instance / parquet 하위 폴더를 사용한다.
+    """
+
+    DEFAULT_TTL = 600
+    DEFAULT_MAX_ENTRIES = 64
+
+    _shared_dict = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, parquet_path=None, enable=True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.parquet_path = parquet_path
+        self.enable = enable
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+        if self.parquet_path is not None:
+            os.makedirs(self.parquet_path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config_report, config):
+        """
+        report config 의 query_cache 항목으로 process 공용 target 별 cache 생성 (target 마다 최초 1회)
+        """
+        target_name = TargetFanOut.get_target_name(config)
+
+        with cls._shared_lock:
+            if target_name not in cls._shared_dict:
+                cache_config = config_report.get("query_cache", {})
+                parquet_path = cache_config.get("parquet_path")
+                cls._shared_dict[target_name] = cls(
+                    ttl=cache_config.get("ttl", cls.DEFAULT_TTL),
+                    max_entries=cache_config.get("max_entries", cls.DEFAULT_MAX_ENTRIES),
+                    parquet_path=None if parquet_path is None else os.path.join(parquet_path, target_name),
+                    enable=cache_config.get("enable", True),
+                )
+            return cls._shared_dict[target_name]
+
+    @staticmethod
+    def make_key(filename, query):
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        return f"{filename}_{query_hash}"
+
+    def get(self, filename, query):
+        """
+        cache 된 dataframe 복사본 반환, 없거나 만료되었으면 None
+        """
+        if not self.enable:
+            return None
+
+        key = self.make_key(filename, query)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                created, df = entry
+
+                if not self._is_expired(created):
+                    self._entries.move_to_end(key)
+                    return df.copy()
+
+                del self._entries[key]
+
+        df = self._read_parquet(key)
+
+        if df is not None:
+            self._put_memory(key, df)
+            return df.copy()
+
+        return None
+
+    def put(self, filename, query, df):
+        if not self.enable or df is None:
+            return
+
+        key = self.make_key(filename, query)
+        self._put_memory(key, df.copy())
+        self._write_parquet(key, df)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _is_expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _put_memory(self, key, df):
+        with self._lock:
+            self._entries[key] = (time.time(), df)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _parquet_file(self, key):
+        return f"{self.parquet_path}/{key}.parquet"
+
+    def _read_parquet(self, key):
+        if self.parquet_path is None:
+            return None
+
+        parquet_file = self._parquet_file(key)
+
+        mtime = QueryCache._get_mtime(parquet_file)
+
+        if mtime is None:
+            return None
+
+        if self._is_expired(mtime):
+            QueryCache._remove_file(parquet_file)
+            return None
+
+        try:
+            return pd.read_parquet(parquet_file)
+        except ImportError:
+            self.parquet_path = None
+            return None
+        except FileNotFoundError:
+            return None
+
+    def _write_parquet(self, key, df):
+        if self.parquet_path is None:
+            return
+
+        parquet_file = self._parquet_file(key)
+        tmp_file = f"{parquet_file}.{threading.get_ident()}.tmp"
+
+        try:
+            df.to_parquet(tmp_file, index=False)
+        except ImportError:
+            self.parquet_path = None
+            return
+        except (ValueError, TypeError, NotImplementedError):
+            # pyarrow ArrowInvalid / ArrowTypeError / ArrowNotImplementedError (object 컬럼 혼합 타입 등)
+            # 는 디스크 layer 만 건너뛰고 메모리 cache 는 유지한다.
+            QueryCache._remove_file(tmp_file)
+            return
+
+        os.replace(tmp_file, parquet_file)
+        self._evict_parquet()
+
+    def _evict_parquet(self):
+        mtime_list = [(QueryCache._get_mtime(parquet_file), parquet_file)
+                      for parquet_file in glob.glob(f"{self.parquet_path}/*.parquet")]
+        parquet_file_list = [parquet_file for mtime, parquet_file in sorted(item for item in mtime_list if item[0] is not None)]
+
+        for parquet_file in parquet_file_list[:-self.max_entries]:
+            QueryCache._remove_file(parquet_file)
+
+    @staticmethod
+    def _get_mtime(path):
+        """다른 process 가 먼저 지웠으면 None"""
+        try:
+            return os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class LocalColumnarStore:
+    """
+    시계열 sql 조회 결과를 target / sql / 일자 단위 parquet 로 보관하는 local store
+    {path}/{target}/{sql 파일명}/{조건 hash}/{YYYYMMDD}.parquet
+    조회 기간 중 없거나 비어 있는 일자만 DB 에서 하루 단위로 조회하여 채우고(sync) 나머지는 parquet 에서 읽는다.
+    오늘과 최근 persist_lag_days 일은 수집이 끝나지 않았을 수 있으므로 저장하지 않고 항상 DB 에서 조회하며,
+    조회 결과가 없는 일자도 저장하지 않는다 (다음 조회 때 다시 확인).
+    report config(local_store): {"enable": true, "path": "...", "sql_list": ["METRIC", ...], "time_col": "DATE_TIME",
+    "persist_lag_days": 1}
+    sql_list 에는 일자별 결과를 이어 붙여도 되는(기간 집계가 없는) sql 만 지정한다.
+    BETWEEN 조건으로 일자 경계 row 가 양쪽 일자에 모두 조회되더라도 time_col 기준 [일자, 다음 일자) 만 남기고,
+    EndDate 시각 row 는 BETWEEN 과 같이 마지막 구간에 포함한다.
+    """
+
+    DATE_FORMAT_LIST = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y%m%d%H%M%S", "%Y%m%d")
+    PARTITION_FORMAT = "%Y%m%d"
+    DEFAULT_TARGET_NAME = "default"
+    DEFAULT_TIME_COL = "DATE_TIME"
+    DEFAULT_PERSIST_LAG_DAYS = 1
+
+    def __init__(self, path, target_name=DEFAULT_TARGET_NAME, sql_list=(), time_col=DEFAULT_TIME_COL,
+                 persist_lag_days=DEFAULT_PERSIST_LAG_DAYS):
+        self.path = path
+        self.target_name = target_name
+        self.sql_set = set(sql_list)
+        self.time_col = time_col
+        self.persist_lag_days = persist_lag_days
+
+    @classmethod
+    def from_config(cls, config_report, config):
+        """local_store 가 꺼져 있거나 pyarrow 가 없으면 None"""
+        store_config = config_report.get("local_store", {})
+
+        if not store_config.get("enable", False) or not store_config.get("path"):
+            return None
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None
+
+        return cls(store_config["path"], TargetFanOut.get_target_name(config), store_config.get("sql_list", []),
+                   store_config.get("time_col", cls.DEFAULT_TIME_COL),
+                   store_config.get("persist_lag_days", cls.DEFAULT_PERSIST_LAG_DAYS))
+
+    def fetch(self, filename, params, query_func):
+        """
+        params 의 StartDate ~ EndDate 기간 데이터 반환 (store 대상이 아니면 None)
+        저장 대상 일자는 sync_range 로 채워 parquet 에서 읽고, 나머지 구간은 DB 에서 한 번에 조회한다.
+        :param query_func: (start_date, end_date) 문자열을 받아 해당 기간 dataframe 을 조회하는 함수
+        """
+        window = self._make_window(filename, params)
+
+        if window is None:
+            return None
+
+        start, end, date_format = window
+        df_list = self.sync_range(filename, params, query_func)
+
+        # 저장하지 않는 최근 구간 (EndDate 는 BETWEEN 과 같이 포함, 전체가 저장 구간이어도 EndDate 시각 row 는 조회)
+        live_start = max(start, min(self._persist_before(), end))
+        live_df = query_func(live_start.strftime(date_format), end.strftime(date_format))
+        df_list.append(self._clip(live_df, live_start, end, include_end=True))
+
+        df_list = [df for df in df_list if df is not None and not df.empty]
+
+        if not df_list:
+            return None
+
+        if len(df_list) == 1:
+            return df_list[0]
+
+        return pd.concat(df_list, ignore_index=True)
+
+    def sync_range(self, filename, params, query_func):
+        """
+        sync 단계: 기간 중 저장 대상 일자(persist_lag_days 보다 오래된 일자) partition 을 채우고 일자별 dataframe 목록 반환
+        없거나 비어 있는 partition 만 DB 에서 하루 단위로 조회하며 report 생성과 별도로 미리 호출해 둘 수 있다.
+        """
+        window = self._make_window(filename, params)
+
+        if window is None:
+            return []
+
+        start, end, date_format = window
+        persist_end = min(end, self._persist_before())
+
+        if persist_end <= start:
+            return []
+
+        partition_dir = self._partition_dir(filename, params)
+        return [self._sync_day(partition_dir, day, date_format, query_func)
+                for day in pd.date_range(start, persist_end, freq="D", inclusive="left")]
+
+    def _make_window(self, filename, params):
+        """store 대상이면 (start, end, date_format), 아니면 None"""
+        if filename not in self.sql_set:
+            return None
+
+        s_date, e_date = str(params["StartDate"]), str(params["EndDate"])
+        date_format = self.find_date_format(s_date)
+
+        if date_format is None:
+            return None
+
+        start, end = pd.Timestamp(s_date), pd.Timestamp(e_date)
+
+        # 일자 경계로 시작/종료하는 기간만 partition 으로 나눌 수 있다
+        if start != start.normalize() or end != end.normalize():
+            return None
+
+        return start, end, date_format
+
+    def _persist_before(self):
+        """이 일자 이전 partition 만 저장 (수집이 끝나지 않았을 수 있는 최근 persist_lag_days 일과 오늘은 저장하지 않음)"""
+        return pd.Timestamp(datetime.now()).normalize() - pd.Timedelta(days=self.persist_lag_days)
+
+    def _sync_day(self, partition_dir, day, date_format, query_func):
+        """day partition 이 없거나 비어 있으면 하루치를 조회하여 (결과가 있을 때만) 저장 후 반환"""
+        partition_file = os.path.join(partition_dir, f"{day.strftime(LocalColumnarStore.PARTITION_FORMAT)}.parquet")
+
+        next_day = day + pd.Timedelta(days=1)
+
+        if os.path.isfile(partition_file):
+            df = self._clip(pd.read_parquet(partition_file), day, next_day)
+
+            if not df.empty:
+                return df
+
+        df = self._clip(query_func(day.strftime(date_format), next_day.strftime(date_format)), day, next_day)
+
+        if df is None or df.empty:
+            return df
+
+        os.makedirs(partition_dir, exist_ok=True)
+        tmp_file = f"{partition_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, partition_file)
+        return df
+
+    def _partition_dir(self, filename, params):
+        """기간 외 조회 조건(metric, event, instance 등)이 다르면 다른 partition"""
+        condition = repr(sorted((k, v) for k, v in params.items() if k not in ("StartDate", "EndDate")))
+        condition_hash = hashlib.sha1(condition.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.path, self.target_name, filename, condition_hash)
+
+    def _clip(self, df, start, end, include_end=False):
+        """
+        time_col 이 start 이상 end 미만(include_end 이면 이하)인 row 만 남긴다 (time_col 이 없거나 시각을 해석할 수 없는 row 는 유지)
+        """
+        if df is None or self.time_col not in df.columns:
+            return df
+
+        time_values = df[self.time_col]
+        if not pd.api.types.is_datetime64_any_dtype(time_values):
+            time_values = pd.to_datetime(time_values.astype(str).str.replace("\n", " ", regex=False),
+                                         format="ISO8601", errors="coerce")
+
+        keep = time_values.isna() | (time_values >= start)
+        keep &= time_values.isna() | ((time_values <= end) if include_end else (time_values < end))
+
+        return df if keep.all() else df[keep].reset_index(drop=True)
+
+    @staticmethod
+    def find_date_format(date_text):
+        """조회 조건 날짜 문자열의 형식 (DATE_FORMAT_LIST 중 하나, 없으면 None)"""
+        for date_format in LocalColumnarStore.DATE_FORMAT_LIST:
+            try:
+                datetime.strptime(date_text, date_format)
+                return date_format
+            except ValueError:
+                continue
+
+        return None
+
+
+class ArrowFrameStore:
+    """
+    조회 결과 dataframe 을 Arrow IPC 파일로 내려두고 memory map 으로 다시 여는 dataset layer
+    get 은 파일 buffer 를 그대로 사용하는(zero-copy) dataframe 을 반환하므로 매번 copy 할 필요가 없다.
+    반환된 dataframe 의 숫자 컬럼은 읽기 전용이므로 값 수정은 새 컬럼 할당으로 한다.
+    파일은 path 아래 process 전용 폴더({target}_xxxx)에 만들어 다른 process / target 과 겹치지 않는다.
+    report config(arrow_dataset): {"enable": true, "path": "..."}
+    """
+
+    SUFFIX = ".arrow"
+
+    def __init__(self, path, target_name=LocalColumnarStore.DEFAULT_TARGET_NAME):
+        os.makedirs(path, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f"{target_name}_", dir=path)
+        self._file_dict = {}
+
+    @classmethod
+    def from_config(cls, config_report, config):
+        """arrow_dataset 이 꺼져 있거나 pyarrow 가 없으면 None"""
+        dataset_config = config_report.get("arrow_dataset", {})
+
+        if not dataset_config.get("enable", False) or not dataset_config.get("path"):
+            return None
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None
+
+        return cls(dataset_config["path"], TargetFanOut.get_target_name(config))
+
+    def __contains__(self, key):
+        return key in self._file_dict
+
+    def put(self, key, df):
+        import pyarrow as pa
+
+        arrow_file = os.path.join(self.path, f"{len(self._file_dict)}{ArrowFrameStore.SUFFIX}")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+        with pa.OSFile(arrow_file, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        self._file_dict[key] = arrow_file
+
+    def get(self, key):
+        import pyarrow as pa
+
+        arrow_file = self._file_dict.get(key)
+
+        if arrow_file is None:
+            return None
+
+        table = pa.ipc.open_file(pa.memory_map(arrow_file, "r")).read_all()
+        return table.to_pandas(split_blocks=True)
+
+    def close(self):
+        """process 전용 폴더 삭제 (이미 만든 dataframe 의 memory map 은 process 종료까지 유효)"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._file_dict.clear()
+
+
+class QueryStreamUtils:
+    """
+    get_data_by_query 가 반환하는 chunk generator 처리 함수 모음
+    """
+
+    @staticmethod
+    def iter_upper_chunks(chunks):
+        for df in chunks:
+            df.columns = [str(i).upper() for i in df.columns]
+            yield df
+
+    @staticmethod
+    def concat_chunks(chunks):
+        """
+        모든 chunk 를 하나의 dataframe 으로 합친다. chunk 가 없으면 None
+        """
+        df_list = list(QueryStreamUtils.iter_upper_chunks(chunks))
+
+        if not df_list:
+            return None
+
+        if len(df_list) == 1:
+            return df_list[0]
+
+        return pd.concat(df_list, ignore_index=True)
+
+    @staticmethod
+    def fetch_df(engine, filename, params, target, store=None):
+        """
+        sql template 조회 결과 dataframe (store(LocalColumnarStore) 대상 sql 이면 store 경유)
+        chart / table 처럼 모든 행이 필요한 section 용이라 조회 기간 전체를 메모리에 올린다.
+        요약값만 필요하면 fold_chunks 와 aggregator(TopNAggregator 등) 를 사용한다.
+        """
+        def query_func(start_date, end_date):
+            day_params = dict(params, StartDate=start_date, EndDate=end_date)
+            return QueryStreamUtils.concat_chunks(engine.prepare(filename, day_params).fetch(target))
+
+        if store is not None:
+            df = store.fetch(filename, params, query_func)
+
+            if df is not None:
+                return df
+
+        return QueryStreamUtils.concat_chunks(engine.prepare(filename, params).fetch(target))
+
+    @staticmethod
+    def fold_chunks(chunks, aggregators):
+        """
+        chunk 를 하나씩 aggregator 에 누적하여 chunk 크기만큼의 메모리만 사용한다.
+        """
+        for df in QueryStreamUtils.iter_upper_chunks(chunks):
+            for aggregator in aggregators:
+                aggregator.feed(df)
+
+        return [aggregator.result() for aggregator in aggregators]
+
+
+class PreparedSql:
+    """
+    SqlTemplate 에 값을 적용한 결과
+    binds 가 None 이면 literal 치환 sql, 아니면 bind 변수(:name) sql 과 bind 값
+    cache_text 는 값이 모두 치환된 sql 로 QueryCache key 로 사용한다.
+    """
+
+    def __init__(self, sql, binds, cache_text):
+        self.sql = sql
+        self.binds = binds
+        self.cache_text = cache_text
+
+    def fetch(self, target):
+        """target(OracleTarget) 에서 chunk generator 반환"""
+        if self.binds is None:
+            return target.get_data_by_query(self.sql)
+
+        return target.get_data_by_query(self.sql, self.binds)
+
+
+class SqlTemplate:
+    """
+    #(name) placeholder 가 있는 sql 파일을 segment 로 한 번만 분해한 template
+    '#(name)' 처럼 따옴표로 감싼 placeholder 는 문자열 값, list / tuple 값은 IN 절 목록으로 처리한다.
+    """
+
+    PLACEHOLDER_PATTERN = re.compile(r"'#\((\w+)\)'|#\((\w+)\)")
+
+    def __init__(self, text):
+        self.segment_list = []
+        pos = 0
+
+        for match in SqlTemplate.PLACEHOLDER_PATTERN.finditer(text):
+            self.segment_list.append(text[pos:match.start()])
+            quoted_name, name = match.groups()
+            self.segment_list.append((quoted_name or name, quoted_name is not None))
+            pos = match.end()
+
+        self.segment_list.append(text[pos:])
+
+    def render(self, params):
+        """값을 sql literal 로 치환"""
+        sql_list = []
+
+        for segment in self.segment_list:
+            if isinstance(segment, str):
+                sql_list.append(segment)
+                continue
+
+            name, quoted = segment
+            value = params.get(name, "")
+
+            if quoted:
+                sql_list.append(SqlTemplate._quote(value))
+
+            elif isinstance(value, (list, tuple)):
+                sql_list.append(SqlTemplate._in_list(tuple(value)))
+
+            else:
+                sql_list.append(str(value))
+
+        return "".join(sql_list)
+
+    def prepare(self, params, bind=False):
+        """
+        bind 이면 placeholder 를 bind 변수로 바꿔 값이 달라도 sql 문장이 같도록 한다.
+        list 값은 :name_0, :name_1 ... 로 펼친다.
+        """
+        cache_text = self.render(params)
+
+        if not bind:
+            return PreparedSql(cache_text, None, cache_text)
+
+        sql_list = []
+        binds = {}
+
+        for segment in self.segment_list:
+            if isinstance(segment, str):
+                sql_list.append(segment)
+                continue
+
+            name, quoted = segment
+            value = params.get(name, "")
+
+            if not quoted and isinstance(value, (list, tuple)):
+                bind_name_list = [f"{name}_{idx}" for idx in range(len(value))]
+                binds.update(zip(bind_name_list, value))
+                sql_list.append(", ".join(f":{bind_name}" for bind_name in bind_name_list) or "NULL")
+
+            else:
+                binds[name] = value
+                sql_list.append(f":{name}")
+
+        return PreparedSql("".join(sql_list), binds, cache_text)
+
+    @staticmethod
+    def _quote(value):
+        return "'" + str(value).replace("'", "''") + "'"
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _in_list(value_tuple):
+        """IN 절 문자열 ('a', 'b', ...) (metric name 처럼 반복되는 목록은 cache 사용)"""
+        return ", ".join(SqlTemplate._quote(v) for v in value_tuple) or "NULL"
+
+
+class SqlTemplateEngine:
+    """
+    sql 폴더(CHART_SQL) 의 .txt 파일을 process 내에서 한 번만 읽어 SqlTemplate 으로 보관
+    report config 의 sql_template.bind 가 true 이면 bind 변수 sql 로 실행한다.
+    """
+
+    SQL_SUFFIX = ".txt"
+
+    _engine_dict = {}
+    _lock = threading.Lock()
+
+    def __init__(self, sql_path, bind=False):
+        self.sql_path = sql_path
+        self.bind = bind
+        self.template_dict = {}
+
+        for file in os.listdir(sql_path):
+            if file.endswith(SqlTemplateEngine.SQL_SUFFIX):
+                self._load(file[:-len(SqlTemplateEngine.SQL_SUFFIX)])
+
+    @classmethod
+    def get(cls, sql_path, config_report=None):
+        with cls._lock:
+            if sql_path not in cls._engine_dict:
+                bind = (config_report or {}).get("sql_template", {}).get("bind", False)
+                cls._engine_dict[sql_path] = cls(sql_path, bind)
+
+            return cls._engine_dict[sql_path]
+
+    def prepare(self, filename, params):
+        template = self.template_dict.get(filename)
+
+        if template is None:
+            template = self._load(filename)
+
+        return template.prepare(params, self.bind)
+
+    def has(self, filename):
+        """sql 폴더에 filename.txt 가 있는지"""
+        return filename in self.template_dict
+
+    def _load(self, filename):
+        with open(os.path.join(self.sql_path, filename + SqlTemplateEngine.SQL_SUFFIX), encoding="utf-8") as f:
+            template = SqlTemplate(f.read())
+
+        self.template_dict[filename] = template
+        return template
+
+
+class TopNAggregator:
+    """
+    group 별 sort_col 기준 상위 n 건만 유지하는 누적 집계 (wait event top-n 용)
+    """
+
+    def __init__(self, sort_col, n, group_col="INSTANCE_NUMBER", ascending=True):
+        self.sort_col = sort_col
+        self.n = n
+        self.group_col = group_col
+        self.ascending = ascending
+        self._top_df = None
+
+    def feed(self, df):
+        merged_df = df if self._top_df is None else pd.concat([self._top_df, df], ignore_index=True)
+        sorted_df = merged_df.sort_values(self.sort_col, ascending=self.ascending, kind="stable")
+        self._top_df = sorted_df.groupby(self.group_col, sort=False).head(self.n)
+
+    def result(self):
+        if self._top_df is None:
+            return pd.DataFrame()
+
+        return self._top_df.sort_values([self.group_col, self.sort_col], ascending=[True, self.ascending],
+                                         kind="stable").reset_index(drop=True)
+
+
+class WorkbookSession:
+    """
+    workbook 을 한 번만 load 하여 메모리 상의 sheet 에 데이터 / style / chart 를 모두 반영하고
+    with 블록 종료 시 한 번만 save 한다.
+    """
+
+    def __init__(self, excel_file_path):
+        self.excel_file_path = excel_file_path
+        self.exists = os.path.isfile(excel_file_path)
+        self.wb = None
+
+    def __enter__(self):
+        if self.exists:
+            self.wb = load_workbook(self.excel_file_path)
+        else:
+            self.wb = Workbook()
+            self.wb.remove(self.wb.active)
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.save()
+
+        self.wb.close()
+
+    def save(self):
+        self.wb.save(self.excel_file_path)
+
+    def sheet_names(self):
+        return self.wb.sheetnames
+
+    def create_sheets(self, sheet_name_list):
+        for sheet_name in sheet_name_list:
+            if sheet_name not in self.wb.sheetnames:
+                self.wb.create_sheet(sheet_name)
+
+    def write_df(self, sheet_name, df, startcol, startrow, mode="overlay"):
+        """
+        dataframe(header 포함, index 제외)을 sheet 의 (startrow, startcol) 위치부터 기록 (0-based)
+        mode "replace" 는 기존 sheet 를 같은 위치에 새로 만든 뒤 기록한다.
+        """
+        if sheet_name in self.wb.sheetnames and mode == "replace":
+            sheet_idx = self.wb.sheetnames.index(sheet_name)
+            self.wb.remove(self.wb[sheet_name])
+            ws = self.wb.create_sheet(sheet_name, sheet_idx)
+
+        elif sheet_name in self.wb.sheetnames:
+            ws = self.wb[sheet_name]
+
+        else:
+            ws = self.wb.create_sheet(sheet_name)
+
+        for col_idx, col_name in enumerate(df.columns, start=startcol + 1):
+            ws.cell(row=startrow + 1, column=col_idx, value=col_name)
+
+        for row_idx, row in enumerate(df.itertuples(index=False), start=startrow + 2):
+            for col_idx, value in enumerate(row, start=startcol + 1):
+                ws.cell(row=row_idx, column=col_idx, value=None if pd.isna(value) else value)
+
+        return ws
+
+    def append_df(self, sheet_name, df, header_row, startcol):
+        """
+        sheet 의 header 행(header_row, 1-based) 컬럼 순서에 맞춰 df 를 마지막 행 뒤에 추가
+        header 에 없는 df 컬럼은 무시하고, df 에 없는 header 컬럼은 빈 값으로 둔다.
+        """
+        ws = self.wb[sheet_name]
+        header_list = next(ws.iter_rows(min_row=header_row, max_row=header_row, min_col=startcol + 1, values_only=True))
+        col_list = [col if col in df.columns else None for col in header_list]
+        start_row = ws.max_row + 1
+
+        for row_idx, row in enumerate(df.itertuples(index=False), start=start_row):
+            row_dict = dict(zip(df.columns, row))
+
+            for col_idx, col in enumerate(col_list, start=startcol + 1):
+                if col is None:
+                    continue
+
+                value = row_dict[col]
+                ws.cell(row=row_idx, column=col_idx, value=None if pd.isna(value) else value)
+
+        return ws
+
+
+class StreamingExcelWriter:
+    """
+    write_only workbook 에 sheet 단위로 row 를 흘려 쓰고 close 시 한 번만 저장
+    이전 sheet 를 다시 읽지 않으며 chunk generator 를 넘기면 메모리 사용량은 chunk 크기로 제한된다.
+    """
+
+    def __init__(self, excel_file_path):
+        self.excel_file_path = excel_file_path
+        self.wb = Workbook(write_only=True)
+
+    def write_sheet(self, sheet_name, chunks):
+        """
+        chunk(dataframe) iterable 을 순서대로 하나의 sheet 에 기록 (첫 chunk 의 컬럼을 header 로 사용)
+        """
+        ws = self.wb.create_sheet(sheet_name)
+        header_written = False
+
+        for df in chunks:
+            if not header_written:
+                ws.append([str(col) for col in df.columns])
+                header_written = True
+
+            object_df = df.astype(object).where(df.notna(), None)
+
+            for row in object_df.itertuples(index=False, name=None):
+                ws.append(row)
+
+    def close(self):
+        self.wb.save(self.excel_file_path)
+        self.wb.close()
+
+
+class ChartDownsampler:
+    """
+    line chart point 수 축소 (LTTB / bucket 별 min-max / 고정 간격)
+    어떤 방식이든 series 의 최대값 point 는 유지하여 make_max_value scale 이 달라지지 않는다.
+    """
+
+    METHOD_LTTB = "lttb"
+    METHOD_MINMAX = "minmax"
+    METHOD_INTERVAL = "interval"
+
+    MIN_POINTS = 4
+
+    @staticmethod
+    def select_positions(values, max_points, method=METHOD_MINMAX):
+        """
+        유지할 point 위치(정렬된 positional index) 반환
+        """
+        y = np.nan_to_num(np.asarray(values, dtype=float))
+        n = len(y)
+        max_points = max(int(max_points), ChartDownsampler.MIN_POINTS)
+
+        if n <= max_points:
+            return np.arange(n)
+
+        if method == ChartDownsampler.METHOD_LTTB:
+            positions = ChartDownsampler._lttb(y, max_points)
+
+        elif method == ChartDownsampler.METHOD_INTERVAL:
+            positions = np.linspace(0, n - 1, max_points).astype(int)
+
+        else:
+            positions = ChartDownsampler._min_max(y, max_points)
+
+        return np.unique(np.append(positions, [0, n - 1, int(np.argmax(y))]))
+
+    @staticmethod
+    def _min_max(y, max_points):
+        bucket_list = np.array_split(np.arange(len(y)), max_points // 2)
+        return np.array([idx for bucket in bucket_list for idx in (bucket[np.argmin(y[bucket])], bucket[np.argmax(y[bucket])])])
+
+    @staticmethod
+    def _lttb(y, max_points):
+        n = len(y)
+        x = np.arange(n, dtype=float)
+        bucket_size = (n - 2) / (max_points - 2)
+
+        selected = [0]
+        a = 0
+
+        for i in range(max_points - 2):
+            start = int(np.floor(i * bucket_size)) + 1
+            end = int(np.floor((i + 1) * bucket_size)) + 1
+            next_end = min(int(np.floor((i + 2) * bucket_size)) + 1, n)
+
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+
+            area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+            a = start + int(np.argmax(area))
+            selected.append(a)
+
+        selected.append(n - 1)
+        return np.array(selected)
+
+    @staticmethod
+    def downsample_df(df, value_cols, max_points=None, method=METHOD_MINMAX, group_col=None, category_col=None):
+        """
+        value_cols 각각(group_col 이 있으면 group 별)에서 선택된 point 의 합집합만 남긴다.
+        group 이 category 를 공유하는 chart 는 category_col 값 기준으로 잘라 series 정렬이 유지된다.
+        """
+        if not max_points or not value_cols or df is None or df.empty:
+            return df
+
+        group_list = [df] if group_col is None else [group for _, group in df.groupby(group_col, sort=False)]
+
+        if max(len(group) for group in group_list) <= max_points:
+            return df
+
+        series_max_points = max_points // (len(group_list) * len(value_cols))
+
+        if group_col is None or category_col is None:
+            position_list = [
+                ChartDownsampler.select_positions(df[col].to_numpy(), series_max_points, method) for col in value_cols
+            ]
+            return df.iloc[np.unique(np.concatenate(position_list))]
+
+        category_set = set()
+        for group in group_list:
+            for col in value_cols:
+                positions = ChartDownsampler.select_positions(group[col].to_numpy(), series_max_points, method)
+                category_set.update(group[category_col].iloc[positions])
+
+        return df[df[category_col].isin(category_set)]
+
+    @staticmethod
+    def get_option(config_report):
+        """
+        report config chart_downsample 항목 -> (max_points, method, excel 적용 여부)
+        """
+        option = config_report.get("chart_downsample", {})
+        return (option.get("max_points"), option.get("method", ChartDownsampler.METHOD_MINMAX),
+                option.get("excel", False))
+
+
+class DateTimeLabelFormatter:
+    """
+    chart category 용 DATE_TIME label ("YYYY-MM-DD\nHH:MM:SS") vectorized 생성
+    unique timestamp 에 대해서만 dt.strftime 을 수행하고, 같은 timestamp 배열은 cache 된 label 을 재사용한다.
+    """
+
+    LABEL_FORMAT = "%Y-%m-%d\n%H:%M:%S"
+    # 문자열 DATE_TIME 은 이 형식일 때만 datetime 으로 해석 (그 외는 기존 str + ":00" 규칙)
+    PARSE_FORMAT_LIST = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S")
+    MAX_CACHE_ENTRIES = 32
+
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def format(series):
+        """
+        DATE_TIME series -> label ndarray
+        """
+        codes, uniques = pd.factorize(series)
+        unique_labels = DateTimeLabelFormatter._format_uniques(uniques)
+        labels = unique_labels.take(codes)
+
+        if (codes == -1).any():
+            labels = np.where(codes == -1, "", labels)
+
+        return labels
+
+    @staticmethod
+    def apply(df, col="DATE_TIME"):
+        """
+        df 의 DATE_TIME 컬럼을 label 로 바꾼다 (복사하지 않고 df 를 직접 수정)
+        """
+        if col in df.columns:
+            df[col] = DateTimeLabelFormatter.format(df[col])
+
+        return df
+
+    @staticmethod
+    def _format_uniques(uniques):
+        object_uniques = np.asarray(uniques, dtype=object)
+        key = hashlib.sha1(pd.util.hash_array(object_uniques).tobytes()).hexdigest()
+
+        with DateTimeLabelFormatter._lock:
+            unique_labels = DateTimeLabelFormatter._cache.get(key)
+
+            if unique_labels is not None:
+                DateTimeLabelFormatter._cache.move_to_end(key)
+                return unique_labels
+
+        unique_labels = DateTimeLabelFormatter._make_labels(uniques, object_uniques).to_numpy(dtype=object)
+
+        with DateTimeLabelFormatter._lock:
+            DateTimeLabelFormatter._cache[key] = unique_labels
+
+            while len(DateTimeLabelFormatter._cache) > DateTimeLabelFormatter.MAX_CACHE_ENTRIES:
+                DateTimeLabelFormatter._cache.popitem(last=False)
+
+        return unique_labels
+
+    @staticmethod
+    def _make_labels(uniques, object_uniques):
+        """datetime64 는 그대로, 문자열은 PARSE_FORMAT_LIST 형식으로만 변환하여 label 생성"""
+        if pd.api.types.is_datetime64_any_dtype(uniques):
+            return pd.Series(uniques).dt.strftime(DateTimeLabelFormatter.LABEL_FORMAT)
+
+        series = pd.Series(object_uniques)
+
+        for parse_format in DateTimeLabelFormatter.PARSE_FORMAT_LIST:
+            try:
+                return pd.to_datetime(series, format=parse_format).dt.strftime(DateTimeLabelFormatter.LABEL_FORMAT)
+            except (ValueError, TypeError):
+                continue
+
+        return (series.astype(str) + ":00").str.replace(r"\s+", "\n", regex=True)
+
+
+class DataFramePartition:
+    """
+    key 컬럼 기준으로 한 번만 안정 정렬한 뒤 key 별 구간을 slice 한 view 모음
+    (key 별 boolean mask 를 반복하지 않음, key 순서는 등장 순서 유지)
+    """
+
+    def __init__(self, df, col):
+        self.col = col
+        self._empty_df = df.iloc[0:0]
+
+        codes, uniques = pd.factorize(df[col])
+        order = np.argsort(codes, kind="stable")
+        sorted_df = df.take(order)
+
+        nan_count = int((codes == -1).sum())
+        offsets = nan_count + np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))])
+
+        self._partition_dict = {
+            key: sorted_df.iloc[offsets[idx]:offsets[idx + 1]] for idx, key in enumerate(uniques)
+        }
+
+    def get(self, key):
+        """key 에 해당하는 dataframe (없으면 컬럼만 있는 빈 dataframe)"""
+        return self._partition_dict.get(key, self._empty_df)
+
+    def keys(self):
+        return list(self._partition_dict.keys())
+
+    def items(self):
+        return self._partition_dict.items()
+
+    def values(self):
+        return list(self._partition_dict.values())
+
+    def __len__(self):
+        return len(self._partition_dict)